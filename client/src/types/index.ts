@@ -24,6 +24,9 @@ export interface Analysis {
     expected_value: number | null;
     date_range_start: string | null;
     date_range_end: string | null;
+    campaign_name: string | null;
+    platform: string | null;
+    region: string | null;
     created_at: string;
     notified: boolean;
 }
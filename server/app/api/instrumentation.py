@@ -0,0 +1,104 @@
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Match
+import time
+import logging
+
+from app.core.config import settings
+from app.core import metrics
+from app.db.database import engine, async_engine, sync_db_stats, async_db_stats
+
+logger = logging.getLogger(__name__)
+
+# Statements listed when a slow request is logged
+SLOW_REQUEST_TOP_QUERIES = 5
+
+
+class MetricsMiddleware(BaseHTTPMiddleware):
+    """
+    Record latency, SQL statement count and SQL time per route template.
+
+    Requests slower than SLOW_REQUEST_MS are logged with their slowest
+    statements. Streaming responses are timed until their headers are sent.
+    """
+
+    async def dispatch(self, request: Request, call_next):
+        queries = metrics.start_request_queries()
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            elapsed = time.perf_counter() - start
+            route = _route_template(request)
+            metrics.http_request_duration.observe(elapsed, method=request.method, route=route, status=str(status))
+            metrics.http_request_queries.observe(queries[0], method=request.method, route=route)
+            metrics.http_request_db_time.observe(queries[1], method=request.method, route=route)
+
+            if settings.SLOW_REQUEST_MS and elapsed * 1000 >= settings.SLOW_REQUEST_MS:
+                slowest = sorted(queries[2], key=lambda query: query[0], reverse=True)[:SLOW_REQUEST_TOP_QUERIES]
+                breakdown = "".join(f"\n  {elapsed_ms:.1f} ms: {statement[:300]}" for elapsed_ms, statement in slowest)
+                logger.warning(
+                    f"Slow request {request.method} {request.url.path} ({elapsed * 1000:.1f} ms, status {status}): "
+                    f"{queries[0]} queries, {queries[1] * 1000:.1f} ms in the database{breakdown}"
+                )
+
+
+def metrics_response() -> Response:
+    return Response(metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def _route_template(request: Request) -> str:
+    """
+    Full path template of the route a request matches, so label values stay bounded.
+
+    Matched against the app's routes rather than read from the scope: cache
+    hits and 304s are answered by middleware and never reach the router.
+    """
+    for route in _app_routes(request.app):
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+def _app_routes(app) -> list:
+    """Routes of app with the prefixes of the routers they were included from."""
+    routes = _routes_by_app.get(id(app))
+    if routes is None:
+        try:
+            # FastAPI versions that include routers lazily only expose prefixed paths this way
+            from fastapi.routing import iter_route_contexts
+            routes = list(iter_route_contexts(app.router.routes))
+        except ImportError:
+            routes = list(app.router.routes)
+        _routes_by_app[id(app)] = routes
+    return routes
+
+
+_routes_by_app = {}
+
+
+def _database_samples():
+    """Pool and query counters of both engines, as scrape-time samples."""
+    samples = []
+    for name, stats, bind in (("sync", sync_db_stats, engine), ("async", async_db_stats, async_engine.sync_engine)):
+        snapshot = stats.snapshot(bind)
+        labels = {"engine": name}
+        samples.extend([
+            ("db_queries_total", "counter", "SQL statements executed.", labels, snapshot["queries"]["count"]),
+            ("db_query_seconds_total", "counter", "Time spent executing SQL statements.", labels, snapshot["queries"]["total_ms"] / 1000),
+            ("db_slow_queries_total", "counter", "SQL statements slower than DB_SLOW_QUERY_MS.", labels, snapshot["queries"]["slow"]),
+            ("db_pool_checkouts_total", "counter", "Connection checkouts from the pool.", labels, snapshot["checkouts"]["count"]),
+            ("db_pool_checkout_timeouts_total", "counter", "Checkouts that timed out waiting for a connection.", labels, snapshot["checkouts"]["timeouts"]),
+            ("db_pool_wait_seconds_total", "counter", "Time spent waiting for pool connections.", labels, snapshot["checkouts"]["wait_total_ms"] / 1000),
+        ])
+        if "checkedout" in snapshot["pool"]:
+            samples.append(("db_pool_checked_out", "gauge", "Connections currently checked out.", labels, snapshot["pool"]["checkedout"]))
+    return samples
+
+
+metrics.registry.add_collector(_database_samples)
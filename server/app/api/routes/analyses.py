@@ -1,62 +1,111 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
-from typing import List, Dict
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy import select
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 
-from app.db.database import get_db
+from app.db.database import get_db, get_async_db
+from app.core.config import settings
+from app.api.pagination import paginate, paginate_fast
 from app.db.models import Analysis as AnalysisModel, Recommendation
 from app.schemas.analysis import Analysis as AnalysisSchema, AnalysisWithRecommendations
-from app.services.analysis_service import run_analysis
 from app.services.llm_service import generate_recommendation
-from app.services.notification_service import send_notification_email
+from app.services.export_service import export_response
+from app.services.job_queue import enqueue_job
 
 router = APIRouter()
 
+def analysis_filters(type=None, metric=None, severity=None, platform=None, region=None):
+    """Build the filter conditions shared by the list and export endpoints."""
+    filters = []
+
+    # Apply filters if provided
+    if type:
+        filters.append(AnalysisModel.type == type)
+    if metric:
+        filters.append(AnalysisModel.metric == metric)
+    if severity:
+        filters.append(AnalysisModel.severity == severity)
+    if platform:
+        filters.append(AnalysisModel.platform == platform)
+    if region:
+        filters.append(AnalysisModel.region == region)
+
+    return filters
+
 @router.get("/", response_model=List[AnalysisSchema])
-def get_analyses(
+async def get_analyses(
+        response: Response,
         skip: int = 0,
         limit: int = 100,
         type: str = None,
         metric: str = None,
         severity: str = None,
-        db: Session = Depends(get_db)
+        platform: Optional[str] = None,
+        region: Optional[str] = None,
+        cursor: Optional[str] = None,
+        db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get analyses with optional filtering.
+
+    Pass the X-Next-Cursor header of a page as `cursor` to fetch the next one.
     """
-    query = db.query(AnalysisModel)
+    filters = analysis_filters(type, metric, severity, platform, region)
+    if settings.FAST_LIST_RESPONSES:
+        return await paginate_fast(db, AnalysisModel, AnalysisSchema, filters, response, AnalysisModel.created_at, AnalysisModel.id, limit, skip, cursor)
 
-    # Apply filters if provided
-    if type:
-        query = query.filter(AnalysisModel.type == type)
-    if metric:
-        query = query.filter(AnalysisModel.metric == metric)
-    if severity:
-        query = query.filter(AnalysisModel.severity == severity)
+    query = select(AnalysisModel).filter(*filters)
 
     # Apply pagination and return
-    analyses = query.order_by(AnalysisModel.created_at.desc()).offset(skip).limit(limit).all()
+    analyses = await paginate(db, query, response, AnalysisModel.created_at, AnalysisModel.id, limit, skip, cursor)
     return analyses
 
+@router.get("/export")
+def export_analyses(
+        format: str = "ndjson",
+        type: str = None,
+        metric: str = None,
+        severity: str = None,
+        platform: Optional[str] = None,
+        region: Optional[str] = None
+):
+    """
+    Stream all analyses matching the filters as NDJSON or CSV.
+    """
+    return export_response(
+        AnalysisModel,
+        AnalysisSchema,
+        analysis_filters(type, metric, severity, platform, region),
+        (AnalysisModel.id,),
+        format,
+        "analyses"
+    )
+
 @router.get("/{analysis_id}", response_model=AnalysisWithRecommendations)
-def get_analysis(analysis_id: int, db: Session = Depends(get_db)):
+async def get_analysis(analysis_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Get a specific analysis by ID including its recommendations.
     """
-    analysis = db.query(AnalysisModel).filter(AnalysisModel.id == analysis_id).first()
+    # Relationships can't lazy load under asyncio, fetch recommendations up front
+    analysis = await db.get(AnalysisModel, analysis_id, options=[selectinload(AnalysisModel.recommendations)])
     if analysis is None:
         raise HTTPException(status_code=404, detail="Analysis not found")
     return analysis
 
-@router.post("/run", response_model=Dict[str, str])
-def trigger_analysis(background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+@router.post("/run", response_model=dict)
+def trigger_analysis(db: Session = Depends(get_db)):
     """
-    Trigger an immediate analysis of the campaign data.
+    Queue an immediate analysis of the campaign data.
+
+    While a run is pending or running, its job is returned instead of queueing another.
     """
-    background_tasks.add_task(run_analysis, db)
-    return {"message": "Analysis started in background"}
+    job, created = enqueue_job(db, "run_analysis", dedupe_key="run_analysis")
+    message = "Analysis queued" if created else f"Analysis already {job.status}"
+    return {"message": message, "job_id": job.id}
 
 @router.post("/{analysis_id}/notify", response_model=dict)
-def send_notification(analysis_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+def send_notification(analysis_id: int, db: Session = Depends(get_db)):
     """
     Send a notification for a specific analysis.
     """
@@ -64,5 +113,5 @@ def send_notification(analysis_id: int, background_tasks: BackgroundTasks, db: S
     if analysis is None:
         raise HTTPException(status_code=404, detail="Analysis not found")
 
-    background_tasks.add_task(send_notification_email, db, analysis)
-    return {"message": "Notification queued for sending"}
\ No newline at end of file
+    job, _ = enqueue_job(db, "notify_analysis", {"analysis_id": analysis_id}, dedupe_key=f"notify_analysis:{analysis_id}")
+    return {"message": "Notification queued for sending", "job_id": job.id}
\ No newline at end of file
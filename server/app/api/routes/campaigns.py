@@ -1,16 +1,43 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from datetime import date
 
+from app.core.config import settings
 from app.db.models import Campaign
-from app.schemas.campaign import Campaign as CampaignSchema
-from app.db.database import get_db
+from app.schemas.campaign import Campaign as CampaignSchema, CampaignSummary, BulkIngestResult
+from app.db.database import get_db, get_async_db
+from app.api.pagination import paginate, paginate_fast
+from app.services.export_service import export_response
+from app.services.rollup_service import summary_statement, summary_row, GRANULARITIES, DIMENSIONS
+from app.services.ingestion_service import iter_records, validate_batch, load_campaign_batch, MAX_BATCH_ERRORS
 
 router = APIRouter()
 
+def campaign_filters(campaign_name=None, platform=None, region=None, start_date=None, end_date=None):
+    """Build the filter conditions shared by the list and export endpoints."""
+    filters = []
+
+    # Apply filters if provided
+    if campaign_name:
+        filters.append(Campaign.campaign_name == campaign_name)
+    if platform:
+        filters.append(Campaign.platform == platform)
+    if region:
+        filters.append(Campaign.region == region)
+    if start_date:
+        filters.append(Campaign.date >= start_date)
+    if end_date:
+        filters.append(Campaign.date <= end_date)
+
+    return filters
+
 @router.get("/", response_model=List[CampaignSchema])
-def get_campaigns(
+async def get_campaigns(
+        response: Response,
         skip: int = 0,
         limit: int = 100,
         campaign_name: Optional[str] = None,
@@ -18,35 +45,131 @@ def get_campaigns(
         region: Optional[str] = None,
         start_date: Optional[date] = None,
         end_date: Optional[date] = None,
-        db: Session = Depends(get_db)
+        cursor: Optional[str] = None,
+        db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get campaigns with optional filtering.
+
+    Pass the X-Next-Cursor header of a page as `cursor` to fetch the next one.
     """
-    query = db.query(Campaign)
+    filters = campaign_filters(campaign_name, platform, region, start_date, end_date)
+    if settings.FAST_LIST_RESPONSES:
+        return await paginate_fast(db, Campaign, CampaignSchema, filters, response, Campaign.date, Campaign.id, limit, skip, cursor)
 
-    # Apply filters if provided
-    if campaign_name:
-        query = query.filter(Campaign.campaign_name == campaign_name)
-    if platform:
-        query = query.filter(Campaign.platform == platform)
-    if region:
-        query = query.filter(Campaign.region == region)
-    if start_date:
-        query = query.filter(Campaign.date >= start_date)
-    if end_date:
-        query = query.filter(Campaign.date <= end_date)
+    query = select(Campaign).filter(*filters)
 
     # Apply pagination and return
-    campaigns = query.order_by(Campaign.date.desc()).offset(skip).limit(limit).all()
+    campaigns = await paginate(db, query, response, Campaign.date, Campaign.id, limit, skip, cursor)
     return campaigns
 
+@router.get("/summary", response_model=List[CampaignSummary])
+async def get_campaign_summary(
+        group_by: Optional[str] = None,
+        granularity: str = "day",
+        campaign_name: Optional[str] = None,
+        platform: Optional[str] = None,
+        region: Optional[str] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get campaign totals per day, week or month, grouped by any of campaign_name, platform and region.
+
+    `group_by` is a comma-separated list of dimensions; without it the totals
+    cover all campaigns. CTR, CPC and CPA are computed from the summed
+    clicks, impressions, conversions and spend.
+    """
+    dimensions = [dimension.strip() for dimension in group_by.split(",") if dimension.strip()] if group_by else []
+    if any(dimension not in DIMENSIONS for dimension in dimensions):
+        raise HTTPException(status_code=400, detail=f"group_by must be a subset of {', '.join(DIMENSIONS)}")
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of {', '.join(GRANULARITIES)}")
+
+    statement = summary_statement(
+        dimensions, granularity, start_date, end_date,
+        campaign_name=campaign_name, platform=platform, region=region
+    )
+    return [summary_row(row) for row in await db.execute(statement)]
+
+@router.get("/export")
+def export_campaigns(
+        format: str = "ndjson",
+        campaign_name: Optional[str] = None,
+        platform: Optional[str] = None,
+        region: Optional[str] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None
+):
+    """
+    Stream all campaigns matching the filters as NDJSON or CSV.
+    """
+    return export_response(
+        Campaign,
+        CampaignSchema,
+        campaign_filters(campaign_name, platform, region, start_date, end_date),
+        (Campaign.date, Campaign.id),
+        format,
+        "campaigns"
+    )
+
+@router.post("/bulk", response_model=BulkIngestResult)
+async def bulk_ingest_campaigns(
+        request: Request,
+        format: Optional[str] = None,
+        batch_size: int = settings.INGEST_BATCH_SIZE,
+        db: Session = Depends(get_db)
+):
+    """
+    Stream a CSV or NDJSON body of campaigns into the database.
+
+    Rows are validated and upserted in batches, so re-uploading the same
+    (campaign_name, platform, region, date) keys is idempotent.
+    """
+    # Pick the format from the query string, then the content type
+    if format is None:
+        content_type = request.headers.get("content-type", "")
+        format = "csv" if "csv" in content_type else "ndjson"
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be 'csv' or 'ndjson'")
+    if batch_size < 1:
+        raise HTTPException(status_code=400, detail="batch_size must be positive")
+
+    batches = []
+
+    async def flush(records):
+        accepted, errors = validate_batch(records)
+        # Database work is blocking, keep it off the event loop
+        await run_in_threadpool(load_campaign_batch, db, accepted)
+        batches.append({
+            "batch": len(batches) + 1,
+            "accepted": len(accepted),
+            "rejected": len(errors),
+            "errors": errors[:MAX_BATCH_ERRORS]
+        })
+
+    records = []
+    async for record in iter_records(request.stream(), format):
+        records.append(record)
+        if len(records) >= batch_size:
+            await flush(records)
+            records = []
+    if records:
+        await flush(records)
+
+    return {
+        "accepted": sum(batch["accepted"] for batch in batches),
+        "rejected": sum(batch["rejected"] for batch in batches),
+        "batches": batches
+    }
+
 @router.get("/{campaign_id}", response_model=CampaignSchema)
-def get_campaign(campaign_id: int, db: Session = Depends(get_db)):
+async def get_campaign(campaign_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Get a specific campaign by ID.
     """
-    campaign = db.query(Campaign).filter(Campaign.id == campaign_id).first()
+    campaign = await db.get(Campaign, campaign_id)
     if campaign is None:
         raise HTTPException(status_code=404, detail="Campaign not found")
     return campaign
\ No newline at end of file
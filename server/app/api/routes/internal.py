@@ -0,0 +1,31 @@
+from fastapi import APIRouter
+
+from app.db.database import engine, async_engine, sync_db_stats, async_db_stats
+from app.services.llm_cache import llm_cache
+from app.services.response_cache import response_cache
+
+router = APIRouter()
+
+@router.get("/db-stats", response_model=dict)
+def get_db_stats():
+    """
+    Get connection pool occupancy, connection wait times and query counters per engine.
+    """
+    return {
+        "sync": sync_db_stats.snapshot(engine),
+        "async": async_db_stats.snapshot(async_engine.sync_engine),
+    }
+
+@router.get("/llm-cache-stats", response_model=dict)
+def get_llm_cache_stats():
+    """
+    Get hit/miss counters of the LLM response cache.
+    """
+    return llm_cache.stats()
+
+@router.get("/response-cache-stats", response_model=dict)
+def get_response_cache_stats():
+    """
+    Get hit counters and data versions of the HTTP response cache.
+    """
+    return response_cache.stats()
@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.database import get_async_db
+from app.db.models import Job as JobModel
+from app.schemas.job import Job as JobSchema
+
+router = APIRouter()
+
+@router.get("/{job_id}", response_model=JobSchema)
+async def get_job(job_id: int, db: AsyncSession = Depends(get_async_db)):
+    """
+    Get the status, attempts and timings of a queued job.
+    """
+    job = await db.get(JobModel, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
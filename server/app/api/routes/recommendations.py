@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
-from typing import List, Dict
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Dict, Optional
 
-from app.db.database import get_db
+from app.db.database import get_async_db
+from app.core.config import settings
+from app.api.pagination import paginate, paginate_fast
 from app.db.models import Analysis, Recommendation as RecommendationModel
 from app.schemas.recommendation import Recommendation as RecommendationSchema
 from app.services.llm_service import generate_recommendation
@@ -10,31 +13,39 @@ from app.services.llm_service import generate_recommendation
 router = APIRouter()
 
 @router.get("/", response_model=List[RecommendationSchema])
-def get_recommendations(
+async def get_recommendations(
+        response: Response,
         skip: int = 0,
         limit: int = 100,
         analysis_id: int = None,
-        db: Session = Depends(get_db)
+        cursor: Optional[str] = None,
+        db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get recommendations with optional filtering.
-    """
-    query = db.query(RecommendationModel)
 
+    Pass the X-Next-Cursor header of a page as `cursor` to fetch the next one.
+    """
     # Apply filters if provided
+    filters = []
     if analysis_id:
-        query = query.filter(RecommendationModel.analysis_id == analysis_id)
+        filters.append(RecommendationModel.analysis_id == analysis_id)
+
+    if settings.FAST_LIST_RESPONSES:
+        return await paginate_fast(db, RecommendationModel, RecommendationSchema, filters, response, RecommendationModel.created_at, RecommendationModel.id, limit, skip, cursor)
+
+    query = select(RecommendationModel).filter(*filters)
 
     # Apply pagination and return
-    recommendations = query.order_by(RecommendationModel.created_at.desc()).offset(skip).limit(limit).all()
+    recommendations = await paginate(db, query, response, RecommendationModel.created_at, RecommendationModel.id, limit, skip, cursor)
     return recommendations
 
 @router.get("/{recommendation_id}", response_model=RecommendationSchema)
-def get_recommendation(recommendation_id: int, db: Session = Depends(get_db)):
+async def get_recommendation(recommendation_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Get a specific recommendation by ID.
     """
-    recommendation = db.query(RecommendationModel).filter(RecommendationModel.id == recommendation_id).first()
+    recommendation = await db.get(RecommendationModel, recommendation_id)
     if recommendation is None:
         raise HTTPException(status_code=404, detail="Recommendation not found")
     return recommendation
@@ -42,13 +53,13 @@ def get_recommendation(recommendation_id: int, db: Session = Depends(get_db)):
 @router.post("/generate/{analysis_id}", response_model=dict)
 async def create_recommendation(
         analysis_id: int,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """
     Generate a new recommendation using LLM for a specific analysis.
     """
     # Check if analysis exists
-    analysis = db.query(Analysis).filter(Analysis.id == analysis_id).first()
+    analysis = await db.get(Analysis, analysis_id)
     if analysis is None:
         raise HTTPException(status_code=404, detail="Analysis not found")
 
@@ -0,0 +1,43 @@
+from fastapi import Response
+from typing import Optional
+import orjson
+
+
+class FastJSONResponse(Response):
+    """JSON response encoded with orjson."""
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        # Z for UTC, like the datetimes Pydantic emits
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+
+
+def schema_columns(model, schema):
+    """Columns of model backing each field of a response schema, in field order."""
+    return [getattr(model, field) for field in schema.model_fields]
+
+
+def encode_rows(schema, rows, headers=None) -> FastJSONResponse:
+    """
+    Encode row tuples selected with schema_columns as a list of schema objects.
+
+    No model instances are built: values are only coerced where Pydantic
+    would change them (ints in float fields), so the output is the same as
+    validating through the schema.
+    """
+    fields = list(schema.model_fields)
+    float_indexes = [
+        index for index, field in enumerate(schema.model_fields.values())
+        if field.annotation in (float, Optional[float])
+    ]
+
+    items = []
+    for row in rows:
+        values = list(row)
+        for index in float_indexes:
+            if values[index] is not None:
+                values[index] = float(values[index])
+        items.append(dict(zip(fields, values)))
+
+    return FastJSONResponse(items, headers=headers)
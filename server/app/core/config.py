@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import List, Optional
 import os
 from dotenv import load_dotenv
 
@@ -21,14 +21,82 @@ class Settings(BaseSettings):
     # SQLAlchemy database URL
     DATABASE_URL: Optional[str] = None
 
+    # Connection pool settings (ignored for SQLite)
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # Seconds to wait for a connection
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # Seconds before a connection is replaced
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+    DB_STATEMENT_TIMEOUT_MS: int = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))  # 0 disables the timeout
+    DB_SLOW_QUERY_MS: float = float(os.getenv("DB_SLOW_QUERY_MS", "500"))
+
     @property
     def get_database_url(self) -> str:
         if self.DATABASE_URL:
             return self.DATABASE_URL
-        return f"postgresql://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
+        return f"postgresql+psycopg2://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
+
+    @property
+    def get_async_database_url(self) -> str:
+        # Same database, through the asyncio driver for its backend
+        url = self.get_database_url
+        for sync_scheme, async_scheme in (
+                ("postgresql+psycopg2://", "postgresql+asyncpg://"),
+                ("postgresql://", "postgresql+asyncpg://"),
+                ("sqlite://", "sqlite+aiosqlite://"),
+        ):
+            if url.startswith(sync_scheme):
+                return async_scheme + url[len(sync_scheme):]
+        return url
+
+    @property
+    def get_notification_recipients(self) -> List[str]:
+        return [email.strip() for email in self.EMAILS_TO_EMAIL.split(",") if email.strip()]
 
     # LLM API settings
     MISTRAL_API_KEY: str = os.getenv("MISTRAL_API_KEY", "")
+    MISTRAL_API_URL: str = os.getenv("MISTRAL_API_URL", "https://api.mistral.ai/v1/chat/completions")
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+    LLM_REQUESTS_PER_SECOND: float = float(os.getenv("LLM_REQUESTS_PER_SECOND", "1"))
+    LLM_TOKENS_PER_MINUTE: float = float(os.getenv("LLM_TOKENS_PER_MINUTE", "500000"))
+    LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", "3"))
+    LLM_RETRY_BACKOFF: float = float(os.getenv("LLM_RETRY_BACKOFF", "1"))  # Seconds, doubled per retry
+    LLM_TIMEOUT: float = float(os.getenv("LLM_TIMEOUT", "30"))
+    LLM_CONTEXT_TOKENS: int = int(os.getenv("LLM_CONTEXT_TOKENS", "1500"))  # Budget for the campaign data in a prompt
+    LLM_BATCH_SIZE: int = int(os.getenv("LLM_BATCH_SIZE", "5"))  # Analyses of one series per completion; 1 disables batching
+    LLM_BATCH_TOKEN_BUDGET: int = int(os.getenv("LLM_BATCH_TOKEN_BUDGET", "8000"))  # Prompt plus completion tokens per batch
+    LLM_CONTEXT_TRAILING_DAYS: int = int(os.getenv("LLM_CONTEXT_TRAILING_DAYS", "30"))
+
+    # LLM response cache settings
+    LLM_CACHE_ENABLED: bool = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+    LLM_CACHE_MEMORY_SIZE: int = int(os.getenv("LLM_CACHE_MEMORY_SIZE", "1024"))  # Entries in the in-process LRU
+    LLM_CACHE_MAX_ROWS: int = int(os.getenv("LLM_CACHE_MAX_ROWS", "10000"))  # Rows kept in llm_cache_entries
+    LLM_CACHE_TTL_SECONDS: int = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+    LLM_CACHE_CHANGE_BUCKET: float = float(os.getenv("LLM_CACHE_CHANGE_BUCKET", "25"))  # Percent-change bucket width
+
+    # Serve list endpoints from projected rows encoded with orjson
+    FAST_LIST_RESPONSES: bool = os.getenv("FAST_LIST_RESPONSES", "false").lower() == "true"
+
+    # Instrumentation settings
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true"  # Serve /metrics
+    SLOW_REQUEST_MS: float = float(os.getenv("SLOW_REQUEST_MS", "1000"))  # Log slower requests with their queries; 0 disables
+
+    # Response cache settings
+    RESPONSE_CACHE_ENABLED: bool = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+    RESPONSE_CACHE_SIZE: int = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))  # Responses kept per process
+    RESPONSE_CACHE_MAX_AGE: int = int(os.getenv("RESPONSE_CACHE_MAX_AGE", "0"))  # Cache-Control max-age; clients revalidate with ETags
+    RESPONSE_CACHE_VERSION_TTL: float = float(os.getenv("RESPONSE_CACHE_VERSION_TTL", "1"))  # Seconds between reads of the version counters
+
+    # Scheduler settings
+    SCHEDULER_LEADER_CHECK_SECONDS: int = int(os.getenv("SCHEDULER_LEADER_CHECK_SECONDS", "30"))  # How soon a standby takes over
+
+    # Job queue settings
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", "1"))  # Worker threads started with the API; 0 to run them separately
+    JOB_POLL_INTERVAL: float = float(os.getenv("JOB_POLL_INTERVAL", "1"))  # Seconds between polls of an idle worker
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    JOB_RETRY_BACKOFF: float = float(os.getenv("JOB_RETRY_BACKOFF", "30"))  # Seconds before the first retry, doubled per attempt
+    JOB_LEASE_SECONDS: int = int(os.getenv("JOB_LEASE_SECONDS", "3600"))  # Running jobs without a heartbeat for this long are reclaimed
+    JOB_HEARTBEAT_SECONDS: float = float(os.getenv("JOB_HEARTBEAT_SECONDS", "60"))  # How often a running job renews its lease
 
     # Email settings
     SMTP_SERVER: str = os.getenv("SMTP_SERVER", "localhost")
@@ -36,10 +104,36 @@ class Settings(BaseSettings):
     SMTP_USER: Optional[str] = os.getenv("SMTP_USER", "")
     SMTP_PASSWORD: Optional[str] = os.getenv("SMTP_PASSWORD", "")
     EMAILS_FROM_EMAIL: str = os.getenv("EMAILS_FROM_EMAIL", "test@example.com")
-    EMAILS_TO_EMAIL: str = os.getenv("EMAILS_TO_EMAIL", "user@example.com")
+    EMAILS_TO_EMAIL: str = os.getenv("EMAILS_TO_EMAIL", "user@example.com")  # Comma-separated for several recipients
+    SMTP_TIMEOUT: float = float(os.getenv("SMTP_TIMEOUT", "30"))
+    NOTIFICATION_DIGEST: bool = os.getenv("NOTIFICATION_DIGEST", "true").lower() == "true"  # One email per run and recipient
+
+    # Ingestion settings
+    INGEST_BATCH_SIZE: int = int(os.getenv("INGEST_BATCH_SIZE", "5000"))
 
     # Analysis settings
-    ANALYSIS_SCHEDULE: str = "0 */6 * * *"
-    ANOMALY_THRESHOLD: float = 0.2
+    ANALYSIS_SCHEDULE: str = os.getenv("ANALYSIS_SCHEDULE", "0 */6 * * *")  # Crontab expression
+    # Relative deviation from the baseline flagged by the expanding_mean and seasonal detectors
+    ANOMALY_THRESHOLD: float = float(os.getenv("ANOMALY_THRESHOLD", "0.5"))
+    # Detector per scored metric, as JSON: {"metric": "detector"} or {"metric": {"detector": ..., params}}
+    ANOMALY_DETECTORS: str = os.getenv(
+        "ANOMALY_DETECTORS", '{"ctr": "expanding_mean", "cpc": "expanding_mean", "cpa": "expanding_mean"}'
+    )
+    # 'numpy' scores in the app, 'sql' pushes scoring into Postgres window functions
+    ANOMALY_DETECTION_MODE: str = os.getenv("ANOMALY_DETECTION_MODE", "numpy")
+    # Only score rows newer than each series' persisted watermark
+    INCREMENTAL_ANALYSIS: bool = os.getenv("INCREMENTAL_ANALYSIS", "false").lower() == "true"
+    # Near-real-time analysis of the series that received new rows; ingestion only marks them while enabled
+    REALTIME_ANALYSIS: bool = os.getenv("REALTIME_ANALYSIS", "false").lower() == "true"
+    REALTIME_POLL_SECONDS: int = int(os.getenv("REALTIME_POLL_SECONDS", "5"))  # How often the leader checks for changes
+    REALTIME_DEBOUNCE_SECONDS: int = int(os.getenv("REALTIME_DEBOUNCE_SECONDS", "15"))  # Quiet time before scoring
+    REALTIME_MAX_DELAY_SECONDS: int = int(os.getenv("REALTIME_MAX_DELAY_SECONDS", "120"))  # Score by then even while writes continue
+    REALTIME_BATCH_SERIES: int = int(os.getenv("REALTIME_BATCH_SERIES", "5000"))  # Series per micro-batch
+    # Also score platform x region, platform and region totals, dropping the
+    # series anomalies they explain. Scheduled and on-demand runs only: with
+    # REALTIME_ANALYSIS, micro-batches alert on series anomalies first
+    HIERARCHICAL_ANALYSIS: bool = os.getenv("HIERARCHICAL_ANALYSIS", "true").lower() == "true"
+    # Processes scoring key-range shards of the series in parallel (numpy mode); 1 scores in-process
+    ANALYSIS_WORKERS: int = int(os.getenv("ANALYSIS_WORKERS", "1"))
 
 settings = Settings()
\ No newline at end of file
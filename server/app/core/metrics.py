@@ -0,0 +1,186 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+import bisect
+import threading
+import time
+
+# Prometheus' default latency buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    """Monotonic counter with labels."""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, dict(zip(self.labelnames, key)), value) for key, value in self._values.items()]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._values: Dict[tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, state in self._values.items():
+                labels = dict(zip(self.labelnames, key))
+                cumulative = 0
+                for bound, count in zip(self.buckets, state):
+                    cumulative += count
+                    samples.append((f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+                samples.append((f"{self.name}_bucket", {**labels, "le": "+Inf"}, state[-1]))
+                samples.append((f"{self.name}_sum", labels, state[-2]))
+                samples.append((f"{self.name}_count", labels, state[-1]))
+        return samples
+
+
+class Registry:
+    """Metrics plus callbacks collecting gauges at scrape time, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: List = []
+        self._collectors: List[Callable[[], List[tuple]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], List[tuple]]):
+        """collector returns (name, type, documentation, labels, value) tuples."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(_format_sample(name, labels, value) for name, labels, value in metric.samples())
+
+        described = set()
+        for collector in self._collectors:
+            for name, metric_type, documentation, labels, value in collector():
+                if name not in described:
+                    described.add(name)
+                    lines.append(f"# HELP {name} {documentation}")
+                    lines.append(f"# TYPE {name} {metric_type}")
+                lines.append(_format_sample(name, labels, value))
+
+        return "\n".join(lines) + "\n"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else f"{int(value)}.0"
+
+
+def _escape(label) -> str:
+    return str(label).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_sample(name: str, labels: dict, value) -> str:
+    if labels:
+        rendered = ",".join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+        return f"{name}{{{rendered}}} {float(value)}"
+    return f"{name} {float(value)}"
+
+
+registry = Registry()
+
+# HTTP requests
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "Latency of HTTP requests by route template.", ("method", "route", "status")
+)
+http_request_queries = registry.histogram(
+    "http_request_db_queries", "SQL statements executed per HTTP request.", ("method", "route"),
+    buckets=(0, 1, 2, 5, 10, 25, 50, 100, 250)
+)
+http_request_db_time = registry.histogram(
+    "http_request_db_seconds", "Cumulative SQL time per HTTP request.", ("method", "route")
+)
+
+# Analysis pipeline
+analysis_phase_duration = registry.histogram(
+    "analysis_phase_seconds", "Duration of each run_analysis phase.", ("phase",),
+    buckets=DEFAULT_BUCKETS + (30.0, 60.0, 300.0)
+)
+
+# External services
+llm_request_duration = registry.histogram(
+    "llm_request_duration_seconds", "Latency of completion API calls, per attempt.", ("outcome",),
+    buckets=DEFAULT_BUCKETS + (30.0, 60.0)
+)
+llm_requests = registry.counter(
+    "llm_requests_total", "Completion API attempts by outcome.", ("outcome",)
+)
+smtp_send_duration = registry.histogram(
+    "smtp_send_duration_seconds", "Latency of sending one email, including connecting when needed.", ("outcome",)
+)
+smtp_sends = registry.counter(
+    "smtp_sends_total", "Emails sent by outcome.", ("outcome",)
+)
+
+# Statements of the request being served: [count, seconds, [(milliseconds, statement), ...]]
+_request_queries: ContextVar[Optional[list]] = ContextVar("request_queries", default=None)
+
+
+def start_request_queries() -> list:
+    """Collect the SQL statements run on behalf of the current request (and tasks it spawns)."""
+    queries = [0, 0.0, []]
+    _request_queries.set(queries)
+    return queries
+
+
+def record_request_query(elapsed_ms: float, statement: str):
+    queries = _request_queries.get()
+    if queries is not None:
+        queries[0] += 1
+        queries[1] += elapsed_ms / 1000
+        queries[2].append((elapsed_ms, statement))
@@ -1,9 +1,119 @@
 from apscheduler.schedulers.background import BackgroundScheduler
-from app.services.analysis_service import trigger_analysis
+from apscheduler.triggers.cron import CronTrigger
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.pool import NullPool
+from app.core.config import settings
+from app.db.database import engine
+from app.services.job_queue import enqueue_analysis, enqueue_changed_series_analysis
+from functools import wraps
+import threading
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Postgres advisory lock key held by the instance allowed to fire scheduled jobs
+SCHEDULER_LOCK_KEY = 0x5C4ED01E
+
+# Crontab day-of-week numbers; 7 is Sunday too
+CRON_WEEKDAYS = ("sun", "mon", "tue", "wed", "thu", "fri", "sat")
+
+
+class SchedulerLeader:
+    """
+    Leadership among the instances running a scheduler, through a Postgres advisory lock.
+
+    The lock is session-level, held on a dedicated autocommit connection:
+    if the leader dies or loses that connection, Postgres releases the lock
+    and another instance takes it on its next check. That connection comes
+    from an unpooled engine of its own, so it never takes one of the API
+    pool's DB_POOL_SIZE slots. Other backends have a single instance, which
+    always leads.
+    """
+
+    def __init__(self):
+        self._engine = None
+        self._connection = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return engine.dialect.name == "postgresql"
+
+    def check(self) -> bool:
+        """Keep or try to take leadership; True while this instance leads."""
+        if not self.enabled:
+            return True
+
+        with self._lock:
+            if self._connection is not None:
+                try:
+                    # Still connected means the lock is still held
+                    self._connection.execute(text("SELECT 1"))
+                    return True
+                except SQLAlchemyError:
+                    logger.warning("Lost the scheduler leader connection")
+                    self._discard()
+
+            if self._engine is None:
+                self._engine = create_engine(settings.get_database_url, poolclass=NullPool)
+            connection = self._engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+            try:
+                acquired = connection.execute(
+                    text("SELECT pg_try_advisory_lock(:key)"), {"key": SCHEDULER_LOCK_KEY}
+                ).scalar()
+            except SQLAlchemyError:
+                connection.invalidate()
+                connection.close()
+                raise
+            if not acquired:
+                connection.close()
+                return False
+
+            self._connection = connection
+            logger.info("This instance is now the scheduler leader")
+            return True
+
+    def release(self):
+        with self._lock:
+            if self._connection is None:
+                return
+            try:
+                self._connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": SCHEDULER_LOCK_KEY})
+                self._connection.close()
+            except SQLAlchemyError:
+                self._discard()
+            self._connection = None
+
+    def _discard(self):
+        try:
+            self._connection.invalidate()
+            self._connection.close()
+        except SQLAlchemyError:
+            pass
+        self._connection = None
+
+
+leader = SchedulerLeader()
+
+
+def leader_only(fn):
+    """Wrap a scheduled job so only the current leader runs it."""
+    @wraps(fn)
+    def run():
+        try:
+            leading = leader.check()
+        except SQLAlchemyError as e:
+            logger.error(f"Could not check scheduler leadership, skipping {fn.__name__}: {str(e)}")
+            return
+        if leading:
+            fn()
+        else:
+            logger.debug(f"Not the scheduler leader, skipping {fn.__name__}")
+
+    return run
+
+
 def setup_scheduler():
     """Setup and configure the APScheduler"""
     logger.info("Setting up scheduler")
@@ -11,19 +121,102 @@ def setup_scheduler():
     scheduler = BackgroundScheduler()
 
     # Add jobs to the scheduler
-    # Run daily at midnight
+    # Queue a run on ANALYSIS_SCHEDULE; only the leader queues it and job workers execute it
     scheduler.add_job(
-        trigger_analysis,
-        'cron',
-        hour=0,
-        minute=0,
-        id='daily_analysis',
+        leader_only(enqueue_analysis),
+        cron_trigger(settings.ANALYSIS_SCHEDULE),
+        id='scheduled_analysis',
         replace_existing=True,
-        name='Daily Marketing Analysis'
+        name='Scheduled Marketing Analysis'
     )
 
+    if settings.REALTIME_ANALYSIS:
+        if settings.HIERARCHICAL_ANALYSIS:
+            logger.warning(
+                "REALTIME_ANALYSIS alerts on series anomalies before scheduled runs can suppress "
+                "the ones HIERARCHICAL_ANALYSIS attributes to platform or region shifts"
+            )
+        # Poll the change feed; due micro-batches go through the job queue like full runs
+        scheduler.add_job(
+            leader_only(enqueue_changed_series_analysis),
+            'interval',
+            seconds=settings.REALTIME_POLL_SECONDS,
+            id='changed_series_analysis',
+            replace_existing=True,
+            name='Near-real-time analysis of changed series'
+        )
+
+    if leader.enabled:
+        # Take over promptly when the leader goes away, not just at the next tick
+        scheduler.add_job(
+            _check_leadership,
+            'interval',
+            seconds=settings.SCHEDULER_LEADER_CHECK_SECONDS,
+            id='scheduler_leadership',
+            replace_existing=True,
+            name='Scheduler leadership check'
+        )
+
     # Start the scheduler
     scheduler.start()
-    logger.info("Scheduler started")
+    logger.info(f"Scheduler started, analysis scheduled on '{settings.ANALYSIS_SCHEDULE}'")
+
+    return scheduler
+
+
+def cron_trigger(expression: str) -> CronTrigger:
+    """
+    Trigger for a five-field crontab expression.
+
+    APScheduler numbers weekdays from Monday = 0, so the day-of-week field
+    is expanded into the days it selects in crontab terms (0 = Sunday) and
+    passed by name; ranges and steps keep their crontab meaning.
+    """
+    fields = expression.split()
+    if len(fields) != 5:
+        raise ValueError(f"Expected 5 crontab fields, got {len(fields)}: {expression!r}")
+    fields[4] = _crontab_weekdays(fields[4])
+    return CronTrigger.from_crontab(" ".join(fields))
+
+
+def _crontab_weekdays(field: str) -> str:
+    """Comma-separated day names selected by a crontab day-of-week field."""
+    if field == "*":
+        return field
+
+    days = set()
+    for part in field.lower().split(","):
+        days_range, _, step = part.partition("/")
+        if days_range == "*":
+            first, last = 0, 6
+        elif "-" in days_range:
+            first, last = (_crontab_weekday(day) for day in days_range.split("-", 1))
+        else:
+            first = _crontab_weekday(days_range)
+            last = 7 if step else first
+        if last < first or (step and not step.isdigit()) or step == "0":
+            raise ValueError(f"Invalid day of week in crontab expression: {part!r}")
+        days.update(day % 7 for day in range(first, last + 1, int(step or 1)))
+
+    return ",".join(CRON_WEEKDAYS[day] for day in sorted(days))
+
+
+def _crontab_weekday(value: str) -> int:
+    if value.isdigit() and int(value) <= 7:
+        return int(value)
+    if value in CRON_WEEKDAYS:
+        return CRON_WEEKDAYS.index(value)
+    raise ValueError(f"Invalid day of week in crontab expression: {value!r}")
+
+
+def shutdown_scheduler(scheduler):
+    """Stop the scheduler and hand leadership over to another instance."""
+    scheduler.shutdown()
+    leader.release()
+
 
-    return scheduler
\ No newline at end of file
+def _check_leadership():
+    try:
+        leader.check()
+    except SQLAlchemyError as e:
+        logger.warning(f"Scheduler leadership check failed: {str(e)}")
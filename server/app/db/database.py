@@ -1,14 +1,62 @@
 from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from app.core.config import settings
+from app.db.monitoring import DatabaseStats, timed_pool_class
+
+# Pool and query statistics, one collector per engine
+sync_db_stats = DatabaseStats("sync", settings.DB_SLOW_QUERY_MS)
+async_db_stats = DatabaseStats("async", settings.DB_SLOW_QUERY_MS)
+
+def _engine_options(url: str, pool_class, stats: DatabaseStats, timeout_args: dict) -> dict:
+    """Pool sizing, recycling and statement timeout from settings; SQLite keeps its defaults."""
+    if url.startswith("sqlite"):
+        return {}
+
+    options = {
+        "poolclass": timed_pool_class(pool_class, stats),
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+    if settings.DB_STATEMENT_TIMEOUT_MS:
+        options["connect_args"] = timeout_args
+    return options
 
 # Create SQLAlchemy engine
-engine = create_engine(settings.get_database_url)
+engine = create_engine(
+    settings.get_database_url,
+    **_engine_options(
+        settings.get_database_url,
+        QueuePool,
+        sync_db_stats,
+        {"options": f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"}
+    )
+)
+sync_db_stats.attach(engine)
 
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine and sessions for the API routes; the sync ones above stay
+# in use by the scheduler, background jobs and scripts
+async_engine = create_async_engine(
+    settings.get_async_database_url,
+    **_engine_options(
+        settings.get_async_database_url,
+        AsyncAdaptedQueuePool,
+        async_db_stats,
+        {"server_settings": {"statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS)}}
+    )
+)
+async_db_stats.attach(async_engine.sync_engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # Create Base class
 Base = declarative_base()
 
@@ -18,4 +66,15 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Dependency to get an async DB session
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def dialect_insert(db, table):
+    """Insert construct for the session's backend, with ON CONFLICT support."""
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(table)
+    return sqlite.insert(table)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Boolean, ForeignKey, Text
+from sqlalchemy import Column, Integer, BigInteger, String, Float, Date, DateTime, Boolean, ForeignKey, Text, UniqueConstraint, Index, JSON
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from sqlalchemy.ext.hybrid import hybrid_property
@@ -23,6 +23,35 @@ class Campaign(Base):
     cpa = Column(Float(precision=4))  # Cost per acquisition
     created_at = Column(DateTime(timezone=True), default=func.now())
 
+    __table_args__ = (
+        UniqueConstraint("campaign_name", "platform", "region", "date", name="uq_campaigns_series_date"),
+        Index("idx_campaigns_date_id", "date", "id"),
+    )
+
+class CampaignRollup(Base):
+    __tablename__ = "campaign_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    granularity = Column(String(10), nullable=False)  # 'day', 'week', 'month'
+    group_by = Column(String(50), nullable=False)  # Grouped dimensions, e.g. 'platform,region'; '' for totals
+    period_start = Column(Date, nullable=False)
+    # Dimensions not in group_by hold '' so the unique constraint covers every row
+    campaign_name = Column(String(100), nullable=False, default="")
+    platform = Column(String(50), nullable=False, default="")
+    region = Column(String(50), nullable=False, default="")
+    rows = Column(Integer, nullable=False)  # Campaign rows summed up
+    impressions = Column(BigInteger, nullable=False)
+    clicks = Column(BigInteger, nullable=False)
+    conversions = Column(BigInteger, nullable=False)
+    spend = Column(Float(precision=2), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint(
+            "granularity", "group_by", "period_start", "campaign_name", "platform", "region",
+            name="uq_campaign_rollups_group"
+        ),
+    )
+
 class Analysis(Base):
     __tablename__ = "analyses"
 
@@ -35,9 +64,21 @@ class Analysis(Base):
     expected_value = Column(Float(precision=4))
     date_range_start = Column(Date)
     date_range_end = Column(Date)
+    campaign_name = Column(String(100))  # Series the finding belongs to, if any; None where rolled up
+    platform = Column(String(50))
+    region = Column(String(50))
     created_at = Column(DateTime(timezone=True), default=func.now())
     notified = Column(Boolean, default=False)
 
+    __table_args__ = (
+        UniqueConstraint(
+            "type", "metric", "date_range_start", "date_range_end", "campaign_name", "platform", "region",
+            name="uq_analyses_finding",
+            postgresql_nulls_not_distinct=True
+        ),
+        Index("idx_analyses_created_at_id", "created_at", "id"),
+    )
+
     # Relationships
     recommendations = relationship("Recommendation", back_populates="analysis")
     notifications = relationship("Notification", back_populates="analysis")
@@ -53,6 +94,10 @@ class Recommendation(Base):
     # Relationships
     analysis = relationship("Analysis", back_populates="recommendations")
 
+    __table_args__ = (
+        Index("idx_recommendations_created_at_id", "created_at", "id"),
+    )
+
 class Notification(Base):
     __tablename__ = "notifications"
 
@@ -64,4 +109,85 @@ class Notification(Base):
     sent_at = Column(DateTime(timezone=True), default=func.now())
 
     # Relationships
-    analysis = relationship("Analysis", back_populates="notifications")
\ No newline at end of file
+    analysis = relationship("Analysis", back_populates="notifications")
+
+class SeriesState(Base):
+    __tablename__ = "series_states"
+
+    id = Column(Integer, primary_key=True, index=True)
+    campaign_name = Column(String(100), nullable=False)
+    platform = Column(String(50), nullable=False)
+    region = Column(String(50), nullable=False)
+    last_date = Column(Date, nullable=False)  # Watermark: latest campaign date already scored
+    count = Column(Integer, nullable=False, default=0)  # Points folded into the detector states
+    # Metric -> {"detector": name, "state": [...]}, the online state of each configured detector
+    detector_state = Column(JSON().with_variant(JSONB(), "postgresql"), nullable=False, default=dict)
+    updated_at = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("campaign_name", "platform", "region", name="uq_series_states_series"),
+    )
+
+
+class ChangedSeries(Base):
+    """Series with campaign rows written since near-real-time analysis last scored them."""
+    __tablename__ = "changed_series"
+
+    id = Column(Integer, primary_key=True, index=True)
+    campaign_name = Column(String(100), nullable=False)
+    platform = Column(String(50), nullable=False)
+    region = Column(String(50), nullable=False)
+    first_marked_at = Column(DateTime(timezone=True), nullable=False)  # Kept while the mark is pending
+    last_marked_at = Column(DateTime(timezone=True), nullable=False)  # Moved by every later write
+    first_changed_date = Column(Date, nullable=False)  # Earliest campaign date written since marked
+
+    __table_args__ = (
+        UniqueConstraint("campaign_name", "platform", "region", name="uq_changed_series_series"),
+    )
+
+
+class LLMCacheEntry(Base):
+    __tablename__ = "llm_cache_entries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    fingerprint = Column(String(64), nullable=False, unique=True)  # sha256 of the normalized prompt inputs
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=func.now())
+    last_used_at = Column(DateTime(timezone=True), default=func.now(), index=True)
+    hits = Column(Integer, nullable=False, default=0)
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(50), nullable=False)
+    payload = Column(JSON().with_variant(JSONB(), "postgresql"), nullable=False, default=dict)
+    dedupe_key = Column(String(200))  # At most one pending/running job per key
+    status = Column(String(20), nullable=False, default="pending")  # pending, running, succeeded, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    last_error = Column(Text)
+    worker = Column(String(100))
+    run_after = Column(DateTime(timezone=True), default=func.now())
+    created_at = Column(DateTime(timezone=True), default=func.now())
+    started_at = Column(DateTime(timezone=True))
+    heartbeat_at = Column(DateTime(timezone=True))  # Lease renewed by the running worker
+    finished_at = Column(DateTime(timezone=True))
+
+    __table_args__ = (
+        Index("idx_jobs_status_run_after", "status", "run_after"),
+        Index(
+            "uq_jobs_active_dedupe_key", "dedupe_key", unique=True,
+            postgresql_where=status.in_(["pending", "running"]),
+            sqlite_where=status.in_(["pending", "running"])
+        ),
+    )
+
+
+class DataVersion(Base):
+    __tablename__ = "data_versions"
+
+    name = Column(String(50), primary_key=True)  # 'campaigns', 'analyses', 'recommendations'
+    version = Column(BigInteger, nullable=False, default=0)  # Bumped by every write, invalidating cached responses
+    updated_at = Column(DateTime(timezone=True), default=func.now())
@@ -0,0 +1,109 @@
+from sqlalchemy import event, exc
+import threading
+import time
+import logging
+
+from app.core.metrics import record_request_query
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseStats:
+    """Connection wait and query counters for one engine, safe to update from any thread."""
+
+    def __init__(self, name: str, slow_query_ms: float):
+        self.name = name
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.checkout_timeouts = 0
+            self.wait_total_ms = 0.0
+            self.wait_max_ms = 0.0
+            self.queries = 0
+            self.query_total_ms = 0.0
+            self.slow_queries = 0
+
+    def record_checkout(self, elapsed_ms: float, timed_out: bool = False):
+        with self._lock:
+            self.checkouts += 1
+            self.checkout_timeouts += int(timed_out)
+            self.wait_total_ms += elapsed_ms
+            self.wait_max_ms = max(self.wait_max_ms, elapsed_ms)
+
+    def record_query(self, elapsed_ms: float, statement: str):
+        slow = elapsed_ms >= self.slow_query_ms
+        with self._lock:
+            self.queries += 1
+            self.query_total_ms += elapsed_ms
+            self.slow_queries += int(slow)
+        record_request_query(elapsed_ms, statement)
+        if slow:
+            logger.warning(f"Slow query on {self.name} engine ({elapsed_ms:.1f} ms): {statement[:500]}")
+
+    def attach(self, engine):
+        """Time every statement executed through a (sync) engine."""
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            start = conn.info["query_start"].pop()
+            self.record_query((time.perf_counter() - start) * 1000, statement)
+
+        @event.listens_for(engine, "handle_error")
+        def handle_error(context):
+            # Failed statements never reach after_cursor_execute
+            starts = context.connection.info.get("query_start") if context.connection is not None else None
+            if starts:
+                starts.pop()
+
+    def snapshot(self, engine) -> dict:
+        """Current pool occupancy plus the counters collected so far."""
+        pool = engine.pool
+        pool_status = {"class": type(pool).__name__}
+        # Only queue pools track size and overflow
+        for attribute in ("size", "checkedin", "checkedout", "overflow"):
+            if hasattr(pool, attribute):
+                pool_status[attribute] = getattr(pool, attribute)()
+
+        with self._lock:
+            return {
+                "pool": pool_status,
+                "checkouts": {
+                    "count": self.checkouts,
+                    "timeouts": self.checkout_timeouts,
+                    "wait_total_ms": round(self.wait_total_ms, 3),
+                    "wait_avg_ms": round(self.wait_total_ms / self.checkouts, 3) if self.checkouts else 0.0,
+                    "wait_max_ms": round(self.wait_max_ms, 3),
+                },
+                "queries": {
+                    "count": self.queries,
+                    "total_ms": round(self.query_total_ms, 3),
+                    "slow": self.slow_queries,
+                    "slow_threshold_ms": self.slow_query_ms,
+                },
+            }
+
+
+def timed_pool_class(base, stats: DatabaseStats):
+    """Subclass a pool class so every checkout records how long it waited for a connection."""
+
+    class TimedPool(base):
+        def connect(self):
+            start = time.perf_counter()
+            try:
+                connection = super().connect()
+            except exc.TimeoutError:
+                stats.record_checkout((time.perf_counter() - start) * 1000, timed_out=True)
+                raise
+            stats.record_checkout((time.perf_counter() - start) * 1000)
+            return connection
+
+    TimedPool.__name__ = f"Timed{base.__name__}"
+    return TimedPool
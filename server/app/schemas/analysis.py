@@ -13,6 +13,9 @@ class AnalysisBase(BaseModel):
     expected_value: Optional[float] = None
     date_range_start: Optional[date] = None
     date_range_end: Optional[date] = None
+    campaign_name: Optional[str] = None
+    platform: Optional[str] = None
+    region: Optional[str] = None
 
 class AnalysisCreate(AnalysisBase):
     pass
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import date, datetime
-from typing import Optional
+from typing import Optional, List
 
 class CampaignBase(BaseModel):
     campaign_name: str
@@ -24,3 +24,32 @@ class Campaign(CampaignBase):
 
     class Config:
         from_attributes = True
+
+class CampaignSummary(BaseModel):
+    period_start: date
+    campaign_name: Optional[str] = None
+    platform: Optional[str] = None
+    region: Optional[str] = None
+    rows: int
+    impressions: int
+    clicks: int
+    conversions: int
+    spend: float
+    ctr: float
+    cpc: float
+    cpa: float
+
+class BulkRowError(BaseModel):
+    line: int
+    error: str
+
+class BulkBatchResult(BaseModel):
+    batch: int
+    accepted: int
+    rejected: int
+    errors: List[BulkRowError] = []
+
+class BulkIngestResult(BaseModel):
+    accepted: int
+    rejected: int
+    batches: List[BulkBatchResult]
@@ -0,0 +1,27 @@
+from pydantic import BaseModel, computed_field
+from datetime import datetime
+from typing import Optional
+
+class Job(BaseModel):
+    id: int
+    kind: str
+    payload: dict
+    status: str
+    attempts: int
+    max_attempts: int
+    last_error: Optional[str] = None
+    created_at: datetime
+    run_after: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    @computed_field
+    @property
+    def duration_seconds(self) -> Optional[float]:
+        # Time spent on the last attempt, once finished
+        if self.started_at and self.finished_at:
+            return (self.finished_at - self.started_at).total_seconds()
+        return None
+
+    class Config:
+        from_attributes = True
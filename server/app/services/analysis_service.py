@@ -1,21 +1,54 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, tuple_
-from datetime import datetime, date, timedelta
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy import func, and_, or_, case, null, insert, update
+from datetime import datetime, date, timedelta, timezone
 import numpy as np
+import asyncio
 import logging
 
 from app.core.config import settings
-from app.services.llm_service import generate_recommendation
-from app.services.notification_service import send_notification_email
-from app.db.database import SessionLocal
-from app.db.models import Campaign, Analysis
+from app.core.metrics import analysis_phase_duration
+from app.services.llm_service import generate_recommendations
+from app.services.notification_service import send_notifications
+from app.services.response_cache import bump_versions
+from app.services.change_feed import claim_changed_series, clear_changed_series, clear_stale_marks
+from app.services.hierarchy import find_aggregate_anomalies, suppress_explained
+from app.services.anomaly_engine import (
+    configured_detectors,
+    warmup_days,
+    metric_columns,
+    build_series_arrays,
+    load_series_arrays,
+    find_anomalies_vectorized,
+    find_anomalies_sharded,
+    find_anomalies_sql,
+    sql_detection_supported
+)
+from app.db.database import SessionLocal, dialect_insert
+from app.db.models import Campaign, Analysis, SeriesState, ChangedSeries
 
 logger = logging.getLogger(__name__)
 
 
 def run_analysis(db: Session):
-    """Run analysis on campaign data to identify anomalies and trends."""
+    """
+    Run analysis on campaign data to identify anomalies and trends.
+
+    db should not expire objects on commit: the new analyses are attached
+    from the insert's returned rows and still read after the
+    recommendations commit, which would otherwise reload them one by one.
+
+    Each phase is timed into the analysis_phase_seconds metric: load and
+    detect (inside the detectors), aggregate (platform and region levels),
+    persist (deduplicating insert plus watermarks), recommend, notify and
+    the whole run.
+    """
+    with analysis_phase_duration.time(phase="total"):
+        _run_analysis(db)
+
+
+def _run_analysis(db: Session):
     logger.info("Starting campaign analysis...")
+    started = datetime.now(timezone.utc)
 
     # Get date range for analysis (last 10 days)
     end_date = db.query(func.max(Campaign.date)).scalar()
@@ -26,117 +59,336 @@ def run_analysis(db: Session):
     start_date = end_date - timedelta(days=9)  # Analyze last 10 days
 
     # Run different types of analyses
-    anomalies = detect_anomalies(db, start_date, end_date)
-
-    # First, collect all the unique identifiers for our anomalies
-    anomaly_identifiers = [
-        (
-            "anomaly",
-            anomaly["metric"],
-            anomaly["date"],
-            anomaly["date"]
-        )
-        for anomaly in anomalies
-    ]
+    series_states = []
+    if settings.INCREMENTAL_ANALYSIS:
+        # Only rows past each series' watermark; new series start at the window
+        anomalies, series_states = detect_new_anomalies(db, start_date)
+    else:
+        anomalies = detect_anomalies(db, start_date, end_date)
 
-    # Query existing anomalies in a single database call
-    existing_anomalies = {}
-    if anomaly_identifiers:
-        existing_query = db.query(Analysis).filter(
-            tuple_(
-                Analysis.type,
-                Analysis.metric,
-                Analysis.date_range_start,
-                Analysis.date_range_end
-            ).in_(anomaly_identifiers)
-        ).all()
-
-        # Create a lookup dictionary
-        for existing in existing_query:
-            key = (
-                existing.type,
-                existing.metric,
-                existing.date_range_start,
-                existing.date_range_end
-            )
-            existing_anomalies[key] = existing
+    if settings.HIERARCHICAL_ANALYSIS:
+        # Score the coarser levels too; a shift they explain is reported once, on them
+        with analysis_phase_duration.time(phase="aggregate"):
+            anomalies = suppress_explained(find_aggregate_anomalies(db, start_date, end_date) + anomalies)
 
-    # Collect new anomalies
-    new_analyses = []
-    for anomaly in anomalies:
-        key = (
-            "anomaly",
-            anomaly["metric"],
-            anomaly["date"],
-            anomaly["date"]
-        )
+    # Nothing else consumes change marks; drop the ones this run's reads covered
+    cleared = 0 if settings.REALTIME_ANALYSIS else clear_stale_marks(db, started)
 
-        # Skip if already exists
-        if key in existing_anomalies:
-            continue
-
-        # Create new analysis record
-        analysis = Analysis(
-            type="anomaly",
-            metric=anomaly["metric"],
-            description=anomaly["description"],
-            severity=anomaly["severity"],
-            value=anomaly["value"],
-            expected_value=anomaly["expected_value"],
-            date_range_start=anomaly["date"],
-            date_range_end=anomaly["date"]
-        )
-        new_analyses.append(analysis)
+    _process_anomalies(db, anomalies, series_states, changed=cleared > 0)
 
-    # Bulk insert all new analyses
-    if new_analyses:
-        db.add_all(new_analyses)
-        db.commit()
+    logger.info("Analysis completed")
 
-        # Process the newly added analyses
-        for analysis in new_analyses:
-            db.refresh(analysis)
 
-            # Generate recommendation
-            generate_recommendation(db, analysis)
+def run_changed_series_analysis(db: Session):
+    """
+    Score only the series marked in changed_series, up to REALTIME_BATCH_SERIES of them.
 
-            # Send notification for high severity
-            if analysis.severity == "high":
-                send_notification_email(db, analysis)
+    Rows past each series' watermark are scored as in incremental analysis;
+    series never scored before start at the usual 10-day window, and
+    series with rewritten past rows are replayed (see detect_new_anomalies).
+    The marks are cleared in the same transaction as the analyses they
+    produced.
 
-    logger.info("Analysis completed")
+    Aggregate levels are not scored here, so nothing is suppressed: series
+    anomalies are recorded and alerted on before a later full run can
+    attribute them to a platform or region shift.
+    """
+    end_date = db.query(func.max(Campaign.date)).scalar()
+    claimed = claim_changed_series(db, settings.REALTIME_BATCH_SERIES)
+    if not end_date or not claimed:
+        return
 
+    anomalies, series_states = detect_new_anomalies(
+        db, end_date - timedelta(days=9), changed_ids=[mark_id for mark_id, _ in claimed]
+    )
+    clear_changed_series(db, claimed)
+    _process_anomalies(db, anomalies, series_states, changed=True)
 
-def detect_anomalies(db: Session, start_date: date, end_date: date):
-    """Detect anomalies in campaign metrics."""
-    anomalies = []
+    logger.info(f"Scored {len(claimed)} changed series: {len(anomalies)} anomalies")
 
-    # Get campaigns grouped by campaign identity
-    campaigns = db.query(Campaign).filter(
-        Campaign.date.between(start_date, end_date)
-    ).order_by(Campaign.campaign_name, Campaign.platform, Campaign.region, Campaign.date).all()
 
-    # Simple grouping
-    current_group = []
-    current_key = None
+def _process_anomalies(db: Session, anomalies, series_states, changed: bool = False):
+    """
+    Save anomalies and watermarks, then recommend and notify on the new ones.
 
-    for campaign in campaigns:
-        key = (campaign.campaign_name, campaign.platform, campaign.region)
+    changed means the transaction already holds writes to commit with them.
+    """
+    with analysis_phase_duration.time(phase="persist"):
+        # Advance watermarks in the same transaction as the analyses they produced
+        if series_states:
+            save_series_states(db, series_states)
 
-        # If we're starting a new group, process the previous one
-        if current_key != key:
-            if current_group:
-                anomalies.extend(find_anomalies_in_group(current_group, current_key))
-            current_group = [campaign]
-            current_key = key
-        else:
-            current_group.append(campaign)
+        # Insert all anomalies in one statement; ones already recorded are skipped
+        new_rows = persist_anomalies(db, anomalies)
+        if new_rows:
+            bump_versions(db, "analyses")
+        if new_rows or series_states or changed:
+            db.commit()
 
-    # Process the last group
-    if current_group:
-        anomalies.extend(find_anomalies_in_group(current_group, current_key))
+    # Attach the returned rows as persistent objects without re-reading them
+    new_analyses = []
+    for row in new_rows:
+        analysis = Analysis(**row)
+        make_transient_to_detached(analysis)
+        db.add(analysis)
+        new_analyses.append(analysis)
+
+    # Generate recommendations for the whole batch concurrently; runs happen
+    # in worker threads (scheduler, background tasks), so start a loop here
+    if new_analyses:
+        with analysis_phase_duration.time(phase="recommend"):
+            asyncio.run(generate_recommendations(db, new_analyses))
+
+    # Send notifications for high severity over one SMTP connection
+    with analysis_phase_duration.time(phase="notify"):
+        send_notifications(db, [analysis for analysis in new_analyses if analysis.severity == "high"])
+
+
+def persist_anomalies(db: Session, anomalies):
+    """
+    Insert anomalies as Analysis rows in a single statement, without committing.
+
+    Conflicts on the finding's identity (type, metric, date range and series)
+    are skipped, so overlapping runs never record the same anomaly twice.
+    Returns the column values of the newly inserted rows only.
+    """
+    if not anomalies:
+        return []
+
+    rows = [
+        {
+            "type": "anomaly",
+            "metric": anomaly["metric"],
+            "description": anomaly["description"],
+            "severity": anomaly["severity"],
+            "value": anomaly["value"],
+            "expected_value": anomaly["expected_value"],
+            "date_range_start": anomaly["date"],
+            "date_range_end": anomaly["date"],
+            "campaign_name": anomaly["campaign_name"],
+            "platform": anomaly["platform"],
+            "region": anomaly["region"]
+        }
+        for anomaly in anomalies
+    ]
+    if db.get_bind().dialect.name != "postgresql":
+        rows = _without_recorded_aggregates(db, rows)
+        if not rows:
+            return []
+
+    table = Analysis.__table__
+    statement = dialect_insert(db, table).on_conflict_do_nothing(
+        index_elements=[
+            table.c.type,
+            table.c.metric,
+            table.c.date_range_start,
+            table.c.date_range_end,
+            table.c.campaign_name,
+            table.c.platform,
+            table.c.region
+        ]
+    ).returning(*table.c)
+
+    return [dict(row) for row in db.execute(statement, rows).mappings()]
+
+
+def _without_recorded_aggregates(db: Session, rows):
+    """
+    Drop aggregate findings that are already recorded.
+
+    Postgres matches their NULL dimensions in uq_analyses_finding (NULLS NOT
+    DISTINCT); other backends treat NULLs as distinct, so they are checked here.
+    """
+    aggregates = [row for row in rows if row["campaign_name"] is None]
+    if not aggregates:
+        return rows
+
+    identity = ("type", "metric", "date_range_start", "date_range_end", "campaign_name", "platform", "region")
+    recorded = {
+        tuple(existing) for existing in db.query(*[getattr(Analysis, column) for column in identity]).filter(
+            Analysis.campaign_name.is_(None),
+            Analysis.date_range_start.between(
+                min(row["date_range_start"] for row in aggregates),
+                max(row["date_range_start"] for row in aggregates)
+            )
+        )
+    }
+    return [row for row in rows if tuple(row[column] for column in identity) not in recorded]
+
+
+def detect_anomalies(db: Session, start_date: date, end_date: date):
+    """
+    Detect anomalies in campaign metrics between start_date and end_date.
+
+    Each detector is warmed up on its own warmup_days before start_date
+    (none for expanding_mean), so the first days of the window are scored
+    too; only anomalies inside the window are returned.
+    """
+    anomalies = _detect_anomalies(db, start_date, end_date)
+    return [anomaly for anomaly in anomalies if anomaly["date"] >= start_date]
+
+
+def _detect_anomalies(db: Session, start_date: date, end_date: date):
+    if settings.ANOMALY_DETECTION_MODE == "sql":
+        # Window functions are pushed down to Postgres only; other backends
+        # (e.g. SQLite test runs) and online detectors fall back to scoring in the app
+        if db.get_bind().dialect.name != "postgresql":
+            logger.info("SQL anomaly detection requires Postgres, falling back to in-app scoring")
+        elif not sql_detection_supported():
+            logger.info("SQL anomaly detection only supports expanding_mean detectors, falling back to in-app scoring")
+        else:
+            # Loading and scoring are one query here; expanding means need no warm-up
+            with analysis_phase_duration.time(phase="detect"):
+                return find_anomalies_sql(db, start_date, end_date)
+
+    if settings.ANALYSIS_WORKERS > 1:
+        # Workers load their own shards, so this covers loading too
+        with analysis_phase_duration.time(phase="detect"):
+            return find_anomalies_sharded(db, start_date, end_date, settings.ANALYSIS_WORKERS)
+
+    # Load every series into arrays once and score them in a single batched pass
+    with analysis_phase_duration.time(phase="load"):
+        series = load_series_arrays(db, start_date - timedelta(days=warmup_days()), end_date)
+    with analysis_phase_duration.time(phase="detect"):
+        return find_anomalies_vectorized(series, window_start=start_date)
+
+
+def detect_new_anomalies(db: Session, bootstrap_date: date, changed_ids=None):
+    """
+    Detect anomalies only in rows newer than each series' watermark.
+
+    Series without a SeriesState report anomalies from bootstrap_date on,
+    each detector warmed up on its own warmup_days before it. With
+    changed_ids, only the series of those changed_series marks are read;
+    a series whose mark goes back to or before its watermark (a re-upload
+    of dates already scored) has its detector states replayed over its
+    whole history and reports anomalies from the earliest changed date on.
+    Returns the anomalies and the updated state of every series that had
+    new rows.
+    """
+    # One pass over the new rows, resuming each series' detector states
+    detectors = configured_detectors()
+    with analysis_phase_duration.time(phase="load"):
+        rows = _load_new_rows(db, bootstrap_date - timedelta(days=warmup_days(detectors)), detectors, changed_ids)
+
+    if not rows:
+        return [], []
+
+    with analysis_phase_duration.time(phase="detect"):
+        return _score_new_rows(rows, detectors, bootstrap_date)
+
+
+def _load_new_rows(db: Session, bootstrap_date: date, detectors, changed_ids=None):
+    # Marked dates at or before the watermark were already scored with the old values
+    replayed = ChangedSeries.first_changed_date <= SeriesState.last_date
+    new_rows = Campaign.date > func.coalesce(SeriesState.last_date, bootstrap_date - timedelta(days=1))
+
+    query = db.query(
+        Campaign.campaign_name,
+        Campaign.platform,
+        Campaign.region,
+        Campaign.date,
+        *metric_columns(detectors),
+        SeriesState.id,
+        SeriesState.count,
+        SeriesState.detector_state,
+        (case((replayed, ChangedSeries.first_changed_date)) if changed_ids is not None else null()).label("replay_from")
+    ).outerjoin(
+        SeriesState,
+        and_(
+            SeriesState.campaign_name == Campaign.campaign_name,
+            SeriesState.platform == Campaign.platform,
+            SeriesState.region == Campaign.region
+        )
+    )
+    if changed_ids is not None:
+        query = query.join(
+            ChangedSeries,
+            and_(
+                ChangedSeries.campaign_name == Campaign.campaign_name,
+                ChangedSeries.platform == Campaign.platform,
+                ChangedSeries.region == Campaign.region
+            )
+        ).filter(ChangedSeries.id.in_(changed_ids))
+        new_rows = or_(new_rows, replayed)
+
+    return query.filter(new_rows).order_by(Campaign.campaign_name, Campaign.platform, Campaign.region, Campaign.date).all()
+
+
+def _score_new_rows(rows, detectors, bootstrap_date: date):
+    n_columns = 4 + len(detectors)
+    series = build_series_arrays([row[:n_columns] for row in rows], len(detectors))
+
+    # State columns repeat on every row of a series; any row will do
+    stored = {(row[0], row[1], row[2]): row[n_columns:] for row in rows}
+    state_ids = [stored[key][0] for key in series.keys]
+    replay_from = {key: stored[key][3] for key in series.keys if stored[key][3] is not None}
+    history_counts = np.array(
+        [0 if key in replay_from else stored[key][1] or 0 for key in series.keys], dtype=np.int64
+    )
+
+    # Resume each detector from its saved state; a metric whose detector
+    # changed since (or never ran), or a replayed series, starts over
+    states = []
+    for metric, detector in detectors:
+        state = detector.initial_state(len(series))
+        for i, key in enumerate(series.keys):
+            if key in replay_from:
+                continue
+            saved = (stored[key][2] or {}).get(metric)
+            if saved and saved["detector"] == detector.name and len(saved["state"]) == detector.state_size:
+                state[i] = saved["state"]
+        states.append(state)
+
+    # New series start fresh at bootstrap_date; resumed and replayed ones use every row
+    new_series = {key for key in series.keys if stored[key][0] is None and key not in replay_from}
+    anomalies = find_anomalies_vectorized(
+        series, detectors, states, window_start=[bootstrap_date if key in new_series else None for key in series.keys]
+    )
+
+    # New series only warmed up on their rows before bootstrap_date, and
+    # replayed series on their rows before the earliest changed one
+    report_from = {key: bootstrap_date for key in new_series}
+    report_from.update(replay_from)
+    anomalies = [
+        anomaly for anomaly in anomalies
+        if anomaly["date"] >= report_from.get((anomaly["campaign_name"], anomaly["platform"], anomaly["region"]), date.min)
+    ]
+    if replay_from:
+        logger.info(f"Replayed {len(replay_from)} series with rewritten rows at or before their watermark")
+
+    # States now include the new points
+    total_counts = history_counts + series.lengths
+    last_dates = series.dates[np.arange(len(series)), series.lengths - 1]
+
+    series_states = []
+    for i, (name, platform, region) in enumerate(series.keys):
+        series_states.append({
+            "id": state_ids[i],
+            "campaign_name": name,
+            "platform": platform,
+            "region": region,
+            "last_date": last_dates[i],
+            "count": int(total_counts[i]),
+            "detector_state": {
+                metric: {"detector": detector.name, "state": states[m][i].tolist()}
+                for m, (metric, detector) in enumerate(detectors)
+            }
+        })
+
+    return anomalies, series_states
+
+
+def save_series_states(db: Session, states):
+    """Insert new series states and update existing ones in place, without committing."""
+    new_states = [{k: v for k, v in state.items() if k != "id"} for state in states if state["id"] is None]
+    existing_states = [state for state in states if state["id"] is not None]
+
+    if new_states:
+        db.execute(insert(SeriesState), new_states)
+    if existing_states:
+        db.execute(update(SeriesState), existing_states)
 
-    return anomalies
 
 def find_anomalies_in_group(campaigns, group_key):
     """Find anomalies within a single campaign group."""
@@ -160,6 +412,10 @@ def find_anomalies_in_group(campaigns, group_key):
             # Simple anomaly check
             avg = sum(historical_values) / len(historical_values)
 
+            # No relative deviation from a zero average
+            if avg == 0:
+                continue
+
             # If current value is very different from average (more than 50% difference)
             if abs(current_value - avg) / avg > 0.5:  # 50% threshold
                 direction = "increase" if current_value > avg else "decrease"
@@ -169,6 +425,9 @@ def find_anomalies_in_group(campaigns, group_key):
                 severity = "high" if percent_change > 100 else "medium"
 
                 anomalies.append({
+                    "campaign_name": name,
+                    "platform": platform,
+                    "region": region,
                     "metric": metric_name,
                     "description": f"Unusual {direction} in {metric_name.upper()} ({percent_change:.1f}%) for {name} on {platform} in {region}",
                     "severity": severity,
@@ -182,7 +441,7 @@ def find_anomalies_in_group(campaigns, group_key):
 
 def trigger_analysis():
     """Entry point to run analysis on demand."""
-    db = SessionLocal()
+    db = SessionLocal(expire_on_commit=False)
     try:
         run_analysis(db)
     finally:
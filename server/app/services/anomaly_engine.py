@@ -0,0 +1,403 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func, and_, or_, tuple_, case, cast, Float
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import List, Optional, Tuple
+import multiprocessing
+import threading
+import json
+import numpy as np
+import logging
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.db.models import Campaign
+from app.services.detectors import DETECTORS, ExpandingMean
+
+logger = logging.getLogger(__name__)
+
+# Metrics detectors can be configured on, as (numerator, denominator, scale)
+# over campaign measures; a zero denominator gives 0
+METRIC_RATIOS = {
+    "ctr": ("clicks", "impressions", 1),
+    "cpc": ("spend", "clicks", 1),
+    "cpa": ("spend", "conversions", 1),
+    "conversion_rate": ("conversions", "clicks", 1),
+    "cpm": ("spend", "impressions", 1000),
+}
+
+# Ratios with a generated column on campaigns
+STORED_METRICS = {"ctr": Campaign.ctr, "cpc": Campaign.cpc, "cpa": Campaign.cpa}
+
+
+def _ratio_expression(numerator: str, denominator: str, scale: float):
+    """Per-row SQL expression of a ratio of campaign measures."""
+    value = cast(getattr(Campaign, numerator), Float)
+    if scale != 1:
+        value = value * scale
+    return case((getattr(Campaign, denominator) > 0, value / getattr(Campaign, denominator)), else_=0.0)
+
+
+# Per-row expression of each metric: its stored column, or the ratio of the row's measures
+METRIC_EXPRESSIONS = {
+    metric: STORED_METRICS.get(metric, _ratio_expression(*ratio)) for metric, ratio in METRIC_RATIOS.items()
+}
+
+# Fewest series worth handing to a worker process
+MIN_SHARD_SERIES = 500
+
+
+def configured_detectors() -> List[Tuple[str, object]]:
+    """(metric, detector) pairs from ANOMALY_DETECTORS, in output order."""
+    return _parse_detectors(settings.ANOMALY_DETECTORS)
+
+
+@lru_cache(maxsize=8)
+def _parse_detectors(spec: str):
+    """
+    Parse a JSON object mapping metrics to a detector name, or to an object
+    naming the detector and its parameters:
+
+        {"ctr": "expanding_mean", "cpc": {"detector": "ewma", "alpha": 0.2}}
+    """
+    detectors = []
+    for metric, entry in json.loads(spec).items():
+        if metric not in METRIC_EXPRESSIONS:
+            raise ValueError(f"Unknown metric in ANOMALY_DETECTORS: {metric}")
+        params = {"detector": entry} if isinstance(entry, str) else dict(entry)
+        name = params.pop("detector", None)
+        if name not in DETECTORS:
+            raise ValueError(f"Unknown detector for {metric}: {name}; expected one of {', '.join(DETECTORS)}")
+        try:
+            detectors.append((metric, DETECTORS[name](**params)))
+        except TypeError as e:
+            raise ValueError(f"Invalid parameters for the {name} detector of {metric}: {str(e)}")
+    if not detectors:
+        raise ValueError("ANOMALY_DETECTORS configures no metrics")
+    return tuple(detectors)
+
+
+def warmup_days(detectors=None) -> int:
+    """Days of history to load before a window so every detector can score its first day."""
+    return max(detector.warmup_days for _, detector in detectors or configured_detectors())
+
+
+def metric_columns(detectors) -> list:
+    """Select expressions of the detectors' metrics, labelled with their names."""
+    return [METRIC_EXPRESSIONS[metric].label(metric) for metric, _ in detectors]
+
+
+class SeriesArrays:
+    """Campaign metrics packed into padded (series, day, metric) arrays."""
+
+    def __init__(self, keys, dates, values, lengths):
+        self.keys = keys          # list of (campaign_name, platform, region)
+        self.dates = dates        # object array, shape (series, days)
+        self.values = values      # float64 array, shape (series, days, metrics)
+        self.lengths = lengths    # int array, number of real points per series
+
+    def __len__(self):
+        return len(self.keys)
+
+
+def load_series_arrays(db: Session, start_date: date, end_date: date, key_range: Optional[Tuple] = None) -> SeriesArrays:
+    """
+    Load the configured metrics of every campaign series in the date range in one query.
+
+    key_range (first, last) limits the load to the series keys between the
+    two, inclusive, in (campaign_name, platform, region) order.
+    """
+    query = db.query(
+        Campaign.campaign_name,
+        Campaign.platform,
+        Campaign.region,
+        Campaign.date,
+        *metric_columns(configured_detectors())
+    ).filter(
+        Campaign.date.between(start_date, end_date)
+    )
+    if key_range is not None:
+        query = query.filter(tuple_(Campaign.campaign_name, Campaign.platform, Campaign.region).between(*key_range))
+    rows = query.order_by(Campaign.campaign_name, Campaign.platform, Campaign.region, Campaign.date).all()
+
+    return build_series_arrays(rows, len(configured_detectors()))
+
+
+def build_series_arrays(rows, n_metrics: int) -> SeriesArrays:
+    """
+    Pack rows ordered by (campaign_name, platform, region, date) into arrays.
+
+    Each row is (campaign_name, platform, region, date, *metric values).
+    """
+    if not rows:
+        return SeriesArrays([], np.empty((0, 0), dtype=object), np.empty((0, 0, n_metrics)), np.empty(0, dtype=np.intp))
+
+    names, platforms, regions, dates, *metric_values = zip(*rows)
+    row_keys = list(zip(names, platforms, regions))
+
+    # Series boundaries are wherever the key changes in the ordered result
+    starts = [0] + [i for i in range(1, len(row_keys)) if row_keys[i] != row_keys[i - 1]]
+    starts = np.asarray(starts, dtype=np.intp)
+    lengths = np.diff(np.append(starts, len(row_keys)))
+    keys = [row_keys[i] for i in starts]
+
+    # Scatter the flat rows into a padded, contiguous layout
+    series_index = np.repeat(np.arange(len(starts)), lengths)
+    positions = np.arange(len(row_keys)) - starts[series_index]
+    max_length = int(lengths.max())
+
+    flat_values = np.column_stack([np.asarray(column, dtype=np.float64) for column in metric_values])
+    values = np.zeros((len(starts), max_length, n_metrics), dtype=np.float64)
+    values[series_index, positions] = flat_values
+
+    padded_dates = np.empty((len(starts), max_length), dtype=object)
+    padded_dates[series_index, positions] = dates
+
+    return SeriesArrays(keys, padded_dates, values, lengths)
+
+
+def find_anomalies_vectorized(series: SeriesArrays, detectors=None, states=None, window_start=None):
+    """
+    Score every series and metric with its configured online detector.
+
+    Days are stepped through in order, each one scored across all series at
+    once. With the default configuration (expanding_mean everywhere) this
+    produces the same anomalies, in the same order, as running
+    find_anomalies_in_group over each series. Points whose baseline is zero
+    have no defined relative change and are skipped.
+
+    states holds one detector state array per metric, carrying points seen
+    in earlier runs; it is updated in place with the new points.
+
+    window_start (a date, or one date or None per series) is where a fresh
+    series' window begins: each detector only sees its points from its own
+    warmup_days before that date on, so a long warm-up loaded for one
+    detector does not leak into another's baseline. Series with None, and
+    all series without window_start, use every point.
+    """
+    anomalies = []
+    if len(series) == 0:
+        return anomalies
+
+    detectors = detectors or configured_detectors()
+    values = series.values
+    n_series, max_length, n_metrics = values.shape
+    if states is None:
+        states = [detector.initial_state(n_series) for _, detector in detectors]
+
+    present = np.arange(max_length)[None, :] < series.lengths[:, None]
+    weekdays = np.zeros((n_series, max_length), dtype=np.intp)
+    if any(detector.uses_weekday for _, detector in detectors):
+        weekdays[present] = [day.weekday() for day in series.dates[present]]
+
+    # Points each detector folds in: (series, day) masks, one per metric
+    seen = [present] * len(detectors)
+    if window_start is not None:
+        starts = window_start if isinstance(window_start, (list, tuple)) else [window_start] * n_series
+        fresh = np.array([start is not None for start in starts])
+        first = np.array([start.toordinal() if start is not None else 0 for start in starts], dtype=np.int64)
+        ordinals = np.zeros((n_series, max_length), dtype=np.int64)
+        ordinals[present] = [day.toordinal() for day in series.dates[present]]
+        seen = [
+            present & (~fresh[:, None] | (ordinals >= (first - detector.warmup_days)[:, None]))
+            for _, detector in detectors
+        ]
+
+    expected = np.zeros_like(values)
+    scored = np.zeros(values.shape, dtype=bool)
+    exceeded = np.zeros(values.shape, dtype=bool)
+    for d in range(max_length):
+        for m, (_, detector) in enumerate(detectors):
+            expected[:, d, m], scored[:, d, m], exceeded[:, d, m] = detector.step(
+                states[m], values[:, d, m], seen[m][:, d], weekdays[:, d]
+            )
+
+    zero_baseline = scored & (expected == 0)
+    if zero_baseline.any():
+        logger.warning(f"Skipped {int(zero_baseline.sum())} points with a zero baseline")
+    flagged = scored & ~zero_baseline & exceeded
+
+    # argwhere walks in C order: series, then day, then metric
+    for s, d, m in np.argwhere(flagged):
+        anomalies.append(build_anomaly(
+            series.keys[s],
+            detectors[m][0],
+            values[s, d, m],
+            expected[s, d, m],
+            series.dates[s, d]
+        ))
+
+    return anomalies
+
+
+def plan_shards(db: Session, start_date: date, end_date: date, shards: int) -> List[Tuple]:
+    """
+    Split the series with rows in the date range into contiguous key ranges.
+
+    Returns up to shards (first, last) key pairs of about as many series
+    each, and at least MIN_SHARD_SERIES, in series order.
+    """
+    keys = db.query(
+        Campaign.campaign_name, Campaign.platform, Campaign.region
+    ).filter(
+        Campaign.date.between(start_date, end_date)
+    ).distinct().order_by(Campaign.campaign_name, Campaign.platform, Campaign.region).all()
+
+    size = max(-(-len(keys) // max(shards, 1)), MIN_SHARD_SERIES)
+    return [(tuple(keys[i]), tuple(keys[min(i + size, len(keys)) - 1])) for i in range(0, len(keys), size)]
+
+
+def score_shard(start_date: date, end_date: date, key_range: Tuple):
+    """Load and score one shard in a worker process, with a session of its own."""
+    db = SessionLocal()
+    try:
+        series = load_series_arrays(db, start_date - timedelta(days=warmup_days()), end_date, key_range)
+    finally:
+        db.close()
+    return find_anomalies_vectorized(series, window_start=start_date)
+
+
+def find_anomalies_sharded(db: Session, start_date: date, end_date: date, workers: int):
+    """
+    Score the series in parallel, one key-range shard per worker process.
+
+    Shards are contiguous in series order and their results are concatenated
+    in shard order, so the anomalies match find_anomalies_vectorized over
+    the whole range, order included. Each shard loads the warm-up history
+    before start_date itself.
+    """
+    shards = plan_shards(db, start_date - timedelta(days=warmup_days()), end_date, workers)
+    if len(shards) < 2:
+        return score_shard(start_date, end_date, shards[0]) if shards else []
+
+    pool = _get_pool(workers)
+    futures = [pool.submit(score_shard, start_date, end_date, key_range) for key_range in shards]
+    anomalies = []
+    for future in futures:
+        anomalies.extend(future.result())
+    logger.info(f"Scored {len(shards)} shards across {workers} worker processes")
+    return anomalies
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """Process pool kept across runs, so workers import the app once."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown()
+            # Spawned rather than forked: the parent runs scheduler and job
+            # threads and holds pooled connections a fork would share
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_workers = workers
+        return _pool
+
+
+def shutdown_pool():
+    """Stop the shard worker processes, if any were started."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def sql_detection_supported(detectors=None) -> bool:
+    """Whether the window-function path can score the configured detectors (expanding means only)."""
+    return all(isinstance(detector, ExpandingMean) for _, detector in detectors or configured_detectors())
+
+
+def find_anomalies_sql(db: Session, start_date: date, end_date: date):
+    """
+    Score every series inside the database with window functions.
+
+    Only rows where at least one metric leaves its band are returned, so the
+    app never hydrates the bulk of the window. Supports expanding_mean
+    detectors only; see sql_detection_supported.
+    """
+    detectors = configured_detectors()
+    partition = (Campaign.campaign_name, Campaign.platform, Campaign.region)
+
+    def history(expression):
+        # Aggregate over all prior points of the same series
+        return expression.over(partition_by=partition, order_by=Campaign.date, rows=(None, -1))
+
+    windowed = db.query(
+        Campaign.campaign_name.label("campaign_name"),
+        Campaign.platform.label("platform"),
+        Campaign.region.label("region"),
+        Campaign.date.label("date"),
+        history(func.count()).label("history_count"),
+        *metric_columns(detectors),
+        *[history(func.avg(METRIC_EXPRESSIONS[metric])).label(f"{metric}_avg") for metric, _ in detectors]
+    ).filter(
+        Campaign.date.between(start_date, end_date)
+    ).subquery()
+
+    deviations = []
+    for metric, detector in detectors:
+        value = windowed.c[metric]
+        avg = windowed.c[f"{metric}_avg"]
+        deviations.append(and_(
+            windowed.c.history_count >= detector.min_history,
+            avg != 0,
+            func.abs(value - avg) / avg > detector.threshold
+        ))
+
+    rows = db.query(windowed).filter(
+        or_(*deviations)
+    ).order_by(windowed.c.campaign_name, windowed.c.platform, windowed.c.region, windowed.c.date).all()
+
+    # Re-check each metric of the few returned rows to emit one anomaly per metric
+    anomalies = []
+    for row in rows:
+        key = (row.campaign_name, row.platform, row.region)
+        for metric, detector in detectors:
+            current_value = float(getattr(row, metric))
+            avg = float(getattr(row, f"{metric}_avg"))
+            if row.history_count < detector.min_history:
+                continue
+            if avg != 0 and abs(current_value - avg) / avg > detector.threshold:
+                anomalies.append(build_anomaly(key, metric, current_value, avg, row.date))
+
+    return anomalies
+
+
+def build_anomaly(group_key, metric_name, current_value, avg, anomaly_date):
+    """Describe a single metric deviation in the shape run_analysis persists."""
+    name, platform, region = group_key
+    direction = "increase" if current_value > avg else "decrease"
+    percent_change = abs(current_value - avg) / avg * 100
+
+    # Simple severity: >100% change = high, otherwise medium
+    severity = "high" if percent_change > 100 else "medium"
+
+    return {
+        "campaign_name": name,
+        "platform": platform,
+        "region": region,
+        "metric": metric_name,
+        "description": f"Unusual {direction} in {metric_name.upper()} ({percent_change:.1f}%) for {describe_scope(name, platform, region)}",
+        "severity": severity,
+        "value": float(current_value),
+        "expected_value": float(avg),
+        "date": anomaly_date
+    }
+
+
+def describe_scope(name, platform, region) -> str:
+    """Human-readable series key; aggregates have None for their rolled-up dimensions."""
+    if name is not None:
+        return f"{name} on {platform} in {region}"
+    scope = "all campaigns"
+    if platform is not None:
+        scope += f" on {platform}"
+    if region is not None:
+        scope += f" in {region}"
+    return scope
@@ -0,0 +1,107 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func, delete, bindparam, case
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, List, Tuple
+import logging
+
+from app.core.config import settings
+from app.db.database import dialect_insert
+from app.db.models import ChangedSeries
+
+logger = logging.getLogger(__name__)
+
+
+def mark_changed_series(db: Session, rows: Iterable[Tuple[str, str, str, date]]):
+    """
+    Mark the series of written (campaign_name, platform, region, date) rows as changed, without committing.
+
+    Each mark keeps the earliest date written since it was set. Postgres
+    marks written series with a trigger on campaigns (see init.sql), so
+    this is only needed on other backends, and only with REALTIME_ANALYSIS.
+    """
+    first_dates = {}
+    for name, platform, region, row_date in rows:
+        key = (name, platform, region)
+        first_dates[key] = min(first_dates.get(key, row_date), row_date)
+    if not first_dates:
+        return
+
+    now = datetime.now(timezone.utc)
+    marks = [
+        {"campaign_name": name, "platform": platform, "region": region,
+         "first_marked_at": now, "last_marked_at": now, "first_changed_date": first_date}
+        for (name, platform, region), first_date in first_dates.items()
+    ]
+
+    table = ChangedSeries.__table__
+    statement = dialect_insert(db, table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.campaign_name, table.c.platform, table.c.region],
+        set_={
+            "last_marked_at": statement.excluded.last_marked_at,
+            "first_changed_date": case(
+                (statement.excluded.first_changed_date < table.c.first_changed_date, statement.excluded.first_changed_date),
+                else_=table.c.first_changed_date
+            )
+        }
+    )
+    db.execute(statement, marks)
+
+
+def changes_due(db: Session) -> bool:
+    """
+    Whether pending marks should be scored now.
+
+    Marks are debounced: scoring waits until no series was marked for
+    REALTIME_DEBOUNCE_SECONDS, but never longer than
+    REALTIME_MAX_DELAY_SECONDS after the oldest pending mark.
+    """
+    now = datetime.now(timezone.utc)
+    pending, overdue, recent = db.query(
+        func.count(ChangedSeries.id),
+        func.count(ChangedSeries.id).filter(
+            ChangedSeries.first_marked_at <= now - timedelta(seconds=settings.REALTIME_MAX_DELAY_SECONDS)
+        ),
+        func.count(ChangedSeries.id).filter(
+            ChangedSeries.last_marked_at > now - timedelta(seconds=settings.REALTIME_DEBOUNCE_SECONDS)
+        )
+    ).one()
+    return pending > 0 and (overdue > 0 or recent == 0)
+
+
+def claim_changed_series(db: Session, limit: int) -> List[tuple]:
+    """Up to limit pending marks, oldest first, as (id, last_marked_at) pairs."""
+    return [
+        tuple(row) for row in db.query(ChangedSeries.id, ChangedSeries.last_marked_at)
+        .order_by(ChangedSeries.first_marked_at, ChangedSeries.id)
+        .limit(limit)
+    ]
+
+
+def clear_changed_series(db: Session, claimed: List[tuple]):
+    """
+    Delete claimed marks, without committing.
+
+    A series written again since it was claimed keeps its mark, since
+    those rows may not have been visible when it was scored.
+    """
+    if not claimed:
+        return
+    table = ChangedSeries.__table__
+    statement = delete(table).where(
+        table.c.id == bindparam("mark_id"),
+        table.c.last_marked_at == bindparam("marked_at")
+    )
+    db.execute(statement, [{"mark_id": mark_id, "marked_at": marked_at} for mark_id, marked_at in claimed])
+
+
+def clear_stale_marks(db: Session, cutoff: datetime) -> int:
+    """
+    Delete marks last set before cutoff, without committing; returns how many.
+
+    Without REALTIME_ANALYSIS nothing claims marks, but rows written
+    outside ingestion still get them on Postgres. Full runs clear the
+    ones whose rows they read, so enabling the feature later does not
+    replay every series' history from a years-old first_changed_date.
+    """
+    return db.execute(delete(ChangedSeries).where(ChangedSeries.last_marked_at < cutoff)).rowcount
@@ -0,0 +1,238 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Type
+import numpy as np
+
+from app.core.config import settings
+
+# Detector name -> class; see register_detector
+DETECTORS: Dict[str, Type["Detector"]] = {}
+
+# Scales a MAD to the standard deviation of normally distributed data
+MAD_TO_STD = 1.4826
+
+# Smallest MAD the mad detector uses, relative to the median or value
+MAD_FLOOR = 0.01
+
+
+def register_detector(name: str):
+    """Class decorator adding a Detector to DETECTORS under name."""
+    def register(cls):
+        cls.name = name
+        DETECTORS[name] = cls
+        return cls
+    return register
+
+
+class Detector(ABC):
+    """
+    Online detector scoring many series at once, one day at a time.
+
+    Each series carries a fixed-size float state (state_size values), so a
+    point costs O(1) however long its history. step() scores one day of
+    values against the state built from earlier points, then folds the
+    values of active series into it.
+    """
+
+    name = None
+    state_size = 0
+    uses_weekday = False
+
+    def __init__(self, threshold: float, min_history: int = 2):
+        self.threshold = float(threshold)
+        self.min_history = int(min_history)
+
+    def initial_state(self, n_series: int) -> np.ndarray:
+        return np.zeros((n_series, self.state_size), dtype=np.float64)
+
+    @property
+    def warmup_days(self) -> int:
+        """Days before an analysis window this detector is warmed up on, so its first days are scored."""
+        return self.min_history
+
+    @abstractmethod
+    def step(self, state: np.ndarray, values: np.ndarray, active: np.ndarray, weekdays: np.ndarray):
+        """
+        Score and fold in one day of values, updating state in place.
+
+        active marks the series with a point on this day; weekdays holds
+        their day of the week (Monday = 0) for seasonal detectors. Returns
+        (expected, scored, exceeded) arrays: the baseline each value is
+        compared with, whether there was enough history to score it, and
+        whether it is outside the detector's limits.
+        """
+
+
+@register_detector("expanding_mean")
+class ExpandingMean(Detector):
+    """Relative deviation from the mean of all prior points; state is (count, sum)."""
+
+    state_size = 2
+
+    def __init__(self, threshold: float = None, min_history: int = 2):
+        super().__init__(settings.ANOMALY_THRESHOLD if threshold is None else threshold, min_history)
+
+    @property
+    def warmup_days(self) -> int:
+        # The baseline is the mean of the window's own points, as in find_anomalies_in_group
+        return 0
+
+    def step(self, state, values, active, weekdays):
+        count, total = state[:, 0], state[:, 1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            expected = total / count
+            exceeded = np.abs(values - expected) / expected > self.threshold
+        scored = active & (count >= self.min_history)
+
+        state[active, 0] += 1
+        state[active, 1] += values[active]
+        return expected, scored, exceeded
+
+
+@register_detector("rolling_zscore")
+class RollingZScore(Detector):
+    """
+    Z-score against the mean and standard deviation of the last window points.
+
+    State is (count, sum, sum of squares, ring position, window values): the
+    sums are adjusted as points leave the window rather than recomputed.
+    """
+
+    def __init__(self, window: int = 14, threshold: float = 3.0, min_history: int = 5):
+        super().__init__(threshold, min_history)
+        self.window = int(window)
+        self.state_size = 4 + self.window
+
+    @property
+    def warmup_days(self) -> int:
+        return max(self.window, self.min_history)
+
+    def step(self, state, values, active, weekdays):
+        count, total, squares = state[:, 0], state[:, 1], state[:, 2]
+        points = np.minimum(count, self.window)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            expected = total / points
+            std = np.sqrt(np.maximum(squares / points - expected ** 2, 0))
+            exceeded = np.abs(values - expected) > self.threshold * std
+        scored = active & (points >= self.min_history) & (std > 0)
+
+        rows = np.flatnonzero(active)
+        positions = state[rows, 3].astype(np.intp)
+        evicted = np.where(count[rows] >= self.window, state[rows, 4 + positions], 0.0)
+        new = values[rows]
+        state[rows, 1] += new - evicted
+        state[rows, 2] += new ** 2 - evicted ** 2
+        state[rows, 4 + positions] = new
+        state[rows, 3] = (positions + 1) % self.window
+        state[rows, 0] += 1
+        return expected, scored, exceeded
+
+
+@register_detector("ewma")
+class EWMA(Detector):
+    """
+    Control limits around an exponentially weighted moving average.
+
+    State is (count, mean, variance), both weighted by alpha once
+    min_history points have been averaged evenly; a point is out of control
+    beyond threshold standard deviations from the mean.
+    """
+
+    state_size = 3
+
+    def __init__(self, alpha: float = 0.1, threshold: float = 3.0, min_history: int = 5):
+        super().__init__(threshold, min_history)
+        self.alpha = float(alpha)
+
+    def step(self, state, values, active, weekdays):
+        count, mean, variance = state[:, 0], state[:, 1], state[:, 2]
+        std = np.sqrt(variance)
+        exceeded = np.abs(values - mean) > self.threshold * std
+        scored = active & (count >= self.min_history) & (std > 0)
+        expected = mean.copy()
+
+        # Running (Welford) mean and variance while warming up, then exponential weights
+        weights = np.where(count < self.min_history, 1 / (count + 1), self.alpha)[active]
+        diff = values[active] - mean[active]
+        increment = weights * diff
+        state[active, 1] += increment
+        state[active, 2] = (1 - weights) * (variance[active] + diff * increment)
+        state[active, 0] += 1
+        return expected, scored, exceeded
+
+
+@register_detector("mad")
+class MedianAbsoluteDeviation(Detector):
+    """
+    Robust z-score against a streaming median and median absolute deviation.
+
+    Both start as the mean and mean absolute deviation of the first
+    min_history points, then move by stochastic steps of rate times the
+    current MAD towards each new point, so a single outlier shifts them by
+    a bounded amount. State is (count, median, MAD).
+
+    The MAD is floored at MAD_FLOOR times the larger of the median and the
+    value, so a series that warmed up on constant points still gets scored
+    and its state keeps moving.
+    """
+
+    state_size = 3
+
+    def __init__(self, rate: float = 0.1, threshold: float = 3.5, min_history: int = 5):
+        super().__init__(threshold, min_history)
+        self.rate = float(rate)
+
+    def step(self, state, values, active, weekdays):
+        count, median, mad = state[:, 0], state[:, 1], state[:, 2]
+        deviation = np.abs(values - median)
+        scale = np.maximum(mad, MAD_FLOOR * np.maximum(np.abs(median), np.abs(values)))
+        exceeded = deviation > self.threshold * MAD_TO_STD * scale
+        scored = active & (count >= self.min_history)
+        expected = median.copy()
+
+        warming = active & (count < self.min_history)
+        weights = 1 / (count[warming] + 1)
+        state[warming, 2] += np.where(count[warming] > 0, (deviation[warming] - mad[warming]) * weights, 0)
+        state[warming, 1] += (values[warming] - median[warming]) * weights
+
+        later = active & (count >= self.min_history)
+        steps = scale[later] * self.rate
+        state[later, 1] += steps * np.sign(values[later] - median[later])
+        state[later, 2] += steps * np.sign(deviation[later] - mad[later])
+        state[active, 0] += 1
+        return expected, scored, exceeded
+
+
+@register_detector("seasonal")
+class DayOfWeekBaseline(Detector):
+    """
+    Relative deviation from an EWMA of the same day of the week.
+
+    State is the point count and the moving average of each weekday; a day
+    is scored once its weekday has min_history prior points.
+    """
+
+    state_size = 14
+    uses_weekday = True
+
+    def __init__(self, alpha: float = 0.3, threshold: float = None, min_history: int = 2):
+        super().__init__(settings.ANOMALY_THRESHOLD if threshold is None else threshold, min_history)
+        self.alpha = float(alpha)
+
+    @property
+    def warmup_days(self) -> int:
+        # min_history points of every weekday
+        return 7 * self.min_history
+
+    def step(self, state, values, active, weekdays):
+        rows = np.arange(len(values))
+        count = state[rows, weekdays]
+        expected = state[rows, 7 + weekdays]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            exceeded = np.abs(values - expected) / expected > self.threshold
+        scored = active & (count >= self.min_history)
+
+        rows, days = rows[active], weekdays[active]
+        new = values[active]
+        state[rows, 7 + days] = np.where(count[active] == 0, new, expected[active] + self.alpha * (new - expected[active]))
+        state[rows, days] += 1
+        return expected, scored, exceeded
@@ -0,0 +1,152 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func, select, null, tuple_, union_all
+from collections import Counter
+from datetime import date, timedelta
+import numpy as np
+import logging
+
+from app.db.models import Campaign
+from app.services.rollup_service import MEASURES
+from app.services.anomaly_engine import (
+    METRIC_RATIOS,
+    configured_detectors,
+    warmup_days,
+    build_series_arrays,
+    find_anomalies_vectorized
+)
+
+logger = logging.getLogger(__name__)
+
+# Levels scored above the (campaign_name, platform, region) series, as the dimensions each keeps
+AGGREGATE_LEVELS = (("platform", "region"), ("platform",), ("region",))
+
+# Flagged campaign series an aggregate anomaly must cover to stand for them
+MIN_EXPLAINED_SERIES = 2
+
+
+def load_aggregate_rows(db: Session, start_date: date, end_date: date):
+    """
+    Daily measure totals of every aggregate level, as (platform, region, date, *MEASURES) rows.
+
+    Dimensions a level is not grouped on are None. Postgres computes all
+    levels in a single GROUPING SETS query; other backends (e.g. SQLite test
+    runs) union one GROUP BY per level. Rows come back ordered by series,
+    then date.
+    """
+    sums = [func.sum(getattr(Campaign, measure)).label(measure) for measure in MEASURES]
+    in_window = Campaign.date.between(start_date, end_date)
+
+    if db.get_bind().dialect.name == "postgresql":
+        statement = select(Campaign.platform, Campaign.region, Campaign.date, *sums).where(in_window).group_by(
+            func.grouping_sets(*[
+                tuple_(*[getattr(Campaign, dimension) for dimension in level], Campaign.date)
+                for level in AGGREGATE_LEVELS
+            ])
+        )
+    else:
+        statement = union_all(*[
+            select(
+                *[getattr(Campaign, dimension) if dimension in level else null().label(dimension)
+                  for dimension in ("platform", "region")],
+                Campaign.date,
+                *sums
+            ).where(in_window).group_by(*[getattr(Campaign, dimension) for dimension in level], Campaign.date)
+            for level in AGGREGATE_LEVELS
+        ])
+
+    rows = db.execute(statement).all()
+    # Sorted here so both backends agree; NULL ordering differs between them
+    rows.sort(key=lambda row: (row[0] is None, row[0] or "", row[1] is None, row[1] or "", row[2]))
+    return rows
+
+
+def aggregate_series_arrays(rows, detectors):
+    """Pack aggregate rows into SeriesArrays, deriving each metric's METRIC_RATIOS from the summed measures."""
+    measures = np.array([[float(value or 0) for value in row[3:]] for row in rows], dtype=np.float64).reshape(-1, len(MEASURES))
+    columns = {measure: measures[:, i] for i, measure in enumerate(MEASURES)}
+
+    metric_values = []
+    for metric, _ in detectors:
+        numerator, denominator, scale = METRIC_RATIOS[metric]
+        metric_values.append(np.divide(
+            columns[numerator] * scale, columns[denominator],
+            out=np.zeros(len(rows)), where=columns[denominator] > 0
+        ))
+
+    series_rows = [
+        (None, row[0], row[1], row[2], *values)
+        for row, values in zip(rows, zip(*metric_values))
+    ]
+    return build_series_arrays(series_rows, len(detectors))
+
+
+def find_aggregate_anomalies(db: Session, start_date: date, end_date: date):
+    """
+    Score the platform x region, platform and region totals with the configured detectors.
+
+    Aggregates are scored over the whole window on every run, each detector
+    warmed up on its own warmup_days before it; they have no watermarks. Their anomalies
+    carry None for the rolled-up dimensions.
+    """
+    detectors = configured_detectors()
+    rows = load_aggregate_rows(db, start_date - timedelta(days=warmup_days(detectors)), end_date)
+    if not rows:
+        return []
+    anomalies = find_anomalies_vectorized(aggregate_series_arrays(rows, detectors), detectors, window_start=start_date)
+    return [anomaly for anomaly in anomalies if anomaly["date"] >= start_date]
+
+
+def ancestors(key):
+    """Keys of the aggregate series a (campaign_name, platform, region) key rolls up into."""
+    name, platform, region = key
+    parents = []
+    if name is not None:
+        parents.append((None, platform, region))
+    if platform is not None and region is not None:
+        parents.extend([(None, platform, None), (None, None, region)])
+    return parents
+
+
+def suppress_explained(anomalies):
+    """
+    Report a shift shared by several series once, at the coarsest level that flagged it.
+
+    An aggregate anomaly explains the campaign series anomalies below it in
+    the same metric, on the same day and in the same direction. With at
+    least MIN_EXPLAINED_SERIES of them, those series and the finer
+    aggregates in between are dropped, and the aggregate notes how many
+    series it explains. An aggregate moved by a single flagged series is
+    dropped instead, leaving that series' own anomaly; aggregates with no
+    flagged series below them are kept as they are.
+    """
+    def signature(key, anomaly):
+        return key, anomaly["metric"], anomaly["date"], anomaly["value"] > anomaly["expected_value"]
+
+    def key_of(anomaly):
+        return anomaly["campaign_name"], anomaly["platform"], anomaly["region"]
+
+    # Flagged series below each flagged aggregate
+    flagged = {signature(key_of(anomaly), anomaly) for anomaly in anomalies}
+    series_below = Counter()
+    for anomaly in anomalies:
+        if anomaly["campaign_name"] is not None:
+            for parent in ancestors(key_of(anomaly)):
+                if signature(parent, anomaly) in flagged:
+                    series_below[signature(parent, anomaly)] += 1
+
+    explaining = {parent for parent, count in series_below.items() if count >= MIN_EXPLAINED_SERIES}
+
+    kept = []
+    for anomaly in anomalies:
+        key = signature(key_of(anomaly), anomaly)
+        if any(signature(parent, anomaly) in explaining for parent in ancestors(key_of(anomaly))):
+            continue
+        if anomaly["campaign_name"] is None and 0 < series_below[key] < MIN_EXPLAINED_SERIES:
+            continue
+        if key in explaining:
+            anomaly["description"] += f"; explains {series_below[key]} campaign series"
+        kept.append(anomaly)
+
+    if len(kept) < len(anomalies):
+        logger.info(f"Suppressed {len(anomalies) - len(kept)} anomalies explained by another level")
+    return kept
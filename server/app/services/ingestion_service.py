@@ -0,0 +1,204 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import text, tuple_
+from pydantic import ValidationError
+from typing import List, Tuple
+import csv
+import io
+import json
+import logging
+
+from app.core.config import settings
+from app.db.database import dialect_insert
+from app.db.models import Campaign
+from app.schemas.campaign import CampaignCreate
+from app.services.rollup_service import MEASURES, lock_rollup_days, apply_rollup_deltas
+from app.services.response_cache import bump_versions
+from app.services.change_feed import mark_changed_series
+
+logger = logging.getLogger(__name__)
+
+# Columns written on ingestion; ctr/cpc/cpa are derived from them
+CAMPAIGN_COLUMNS = ("campaign_name", "platform", "region", "date", "impressions", "clicks", "conversions", "spend")
+SERIES_KEY = ("campaign_name", "platform", "region", "date")
+
+# Cap on row errors reported back per batch
+MAX_BATCH_ERRORS = 20
+
+# Series keys per lookup of previously stored values
+KEY_LOOKUP_CHUNK = 1000
+
+
+async def iter_records(chunks, fmt: str):
+    """
+    Turn a byte stream into (line_number, record dict) pairs.
+
+    CSV input must start with a header row. Quoted CSV fields may span lines.
+    """
+    header = None
+    pending = ""
+    line_number = 0
+    record_start = 0
+
+    async for line in _iter_lines(chunks):
+        line_number += 1
+        if fmt == "csv":
+            # Keep joining physical lines while a quoted field is still open
+            if not pending:
+                record_start = line_number
+            pending = f"{pending}\n{line}" if pending else line
+            if pending.count('"') % 2:
+                continue
+            record, pending = pending, ""
+            if not record.strip():
+                continue
+
+            values = next(csv.reader([record]))
+            if header is None:
+                header = [column.strip() for column in values]
+                continue
+            yield record_start, dict(zip(header, values))
+        else:
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_number, e
+
+
+async def _iter_lines(chunks):
+    """Split a stream of byte chunks into decoded lines."""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8-sig").rstrip("\r")
+    if buffer:
+        yield buffer.decode("utf-8-sig").rstrip("\r")
+
+
+def validate_batch(records) -> Tuple[List[CampaignCreate], List[dict]]:
+    """Validate raw records against CampaignCreate, splitting them into accepted rows and errors."""
+    accepted = []
+    errors = []
+
+    for line_number, record in records:
+        if isinstance(record, Exception):
+            errors.append({"line": line_number, "error": f"Invalid JSON: {record}"})
+            continue
+        try:
+            accepted.append(CampaignCreate.model_validate(record))
+        except ValidationError as e:
+            message = "; ".join(
+                f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()
+            )
+            errors.append({"line": line_number, "error": message})
+
+    return accepted, errors
+
+
+def load_campaign_batch(db: Session, campaigns: List[CampaignCreate]) -> int:
+    """
+    Upsert a batch of validated campaigns on (campaign_name, platform, region, date).
+
+    Re-uploading the same keys replaces the previous values, so uploads are
+    idempotent. Postgres loads through COPY into a staging table, other
+    backends through a single executemany. The batch's change to the rows
+    (new values minus any replaced ones) is added to the rollups, and with
+    REALTIME_ANALYSIS its series are marked as changed, in the same
+    transaction.
+    """
+    # Last occurrence of a key within the batch wins
+    rows = {}
+    for campaign in campaigns:
+        row = campaign.model_dump()
+        rows[tuple(row[column] for column in SERIES_KEY)] = row
+    rows = list(rows.values())
+
+    if not rows:
+        return 0
+
+    # Values being replaced are read under the days' lock, so concurrent
+    # batches re-uploading the same keys subtract what the other wrote
+    lock_rollup_days(db, [row["date"] for row in rows])
+    previous = _stored_measures(db, rows)
+
+    if db.get_bind().dialect.name == "postgresql":
+        # A trigger marks the written series for near-real-time analysis,
+        # unless told for this transaction that nothing reads the marks
+        if not settings.REALTIME_ANALYSIS:
+            db.execute(text("SET LOCAL app.mark_changed_series = 'off'"))
+        _copy_campaigns(db, rows)
+    else:
+        _insert_campaigns(db, rows)
+        if settings.REALTIME_ANALYSIS:
+            mark_changed_series(db, [(row["campaign_name"], row["platform"], row["region"], row["date"]) for row in rows])
+
+    apply_rollup_deltas(db, rows, previous)
+    bump_versions(db, "campaigns")
+
+    db.commit()
+    return len(rows)
+
+
+def _stored_measures(db: Session, rows: List[dict]) -> dict:
+    """Measures currently stored for the batch's keys, by key; new keys are absent."""
+    keys = [tuple(row[column] for column in SERIES_KEY) for row in rows]
+    columns = [getattr(Campaign, column) for column in SERIES_KEY]
+
+    stored = {}
+    for i in range(0, len(keys), KEY_LOOKUP_CHUNK):
+        query = db.query(*columns, *[getattr(Campaign, measure) for measure in MEASURES]).filter(
+            tuple_(*columns).in_(keys[i:i + KEY_LOOKUP_CHUNK])
+        )
+        for row in query:
+            stored[tuple(row[:len(SERIES_KEY)])] = dict(zip(MEASURES, row[len(SERIES_KEY):]))
+    return stored
+
+
+def _copy_campaigns(db: Session, rows: List[dict]):
+    """Stream rows into a temp table with COPY, then upsert them in one statement."""
+    columns = ", ".join(CAMPAIGN_COLUMNS)
+    key = ", ".join(SERIES_KEY)
+    updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in CAMPAIGN_COLUMNS if column not in SERIES_KEY)
+
+    db.execute(text(
+        "CREATE TEMP TABLE IF NOT EXISTS campaigns_staging ("
+        "campaign_name VARCHAR(100), platform VARCHAR(50), region VARCHAR(50), date DATE, "
+        "impressions INTEGER, clicks INTEGER, conversions INTEGER, spend DECIMAL(10, 2)"
+        ") ON COMMIT DELETE ROWS"
+    ))
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[column] for column in CAMPAIGN_COLUMNS])
+    buffer.seek(0)
+
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY campaigns_staging ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+    # ctr/cpc/cpa are generated columns on Postgres
+    db.execute(text(
+        f"INSERT INTO campaigns ({columns}) SELECT {columns} FROM campaigns_staging "
+        f"ON CONFLICT ({key}) DO UPDATE SET {updates}"
+    ))
+
+
+def _insert_campaigns(db: Session, rows: List[dict]):
+    """Upsert rows through one executemany, deriving ctr/cpc/cpa the way init.sql does."""
+    for row in rows:
+        row["ctr"] = row["clicks"] / row["impressions"] if row["impressions"] > 0 else 0
+        row["cpc"] = row["spend"] / row["clicks"] if row["clicks"] > 0 else 0
+        row["cpa"] = row["spend"] / row["conversions"] if row["conversions"] > 0 else 0
+
+    statement = dialect_insert(db, Campaign.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=list(SERIES_KEY),
+        set_={column: statement.excluded[column] for column in rows[0] if column not in SERIES_KEY}
+    )
+    db.execute(statement, rows)
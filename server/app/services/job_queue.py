@@ -0,0 +1,329 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, or_, update
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+import os
+import socket
+import threading
+import time
+import logging
+
+from app.core.config import settings
+from app.db.database import SessionLocal, dialect_insert
+from app.db.models import Analysis, Campaign, CampaignRollup, Job
+from app.services.analysis_service import run_analysis, run_changed_series_analysis
+from app.services.change_feed import changes_due
+from app.services.notification_service import send_notification_email
+from app.services.rollup_service import refresh_rollups
+from app.services.response_cache import bump_versions
+
+logger = logging.getLogger(__name__)
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+ACTIVE_STATUSES = (JOB_PENDING, JOB_RUNNING)
+
+
+def _run_analysis_job(db: Session, payload: dict):
+    run_analysis(db)
+
+
+def _analyze_changed_series_job(db: Session, payload: dict):
+    run_changed_series_analysis(db)
+
+
+def _notify_analysis_job(db: Session, payload: dict):
+    analysis = db.get(Analysis, payload["analysis_id"])
+    if analysis is None:
+        logger.warning(f"Analysis {payload['analysis_id']} no longer exists, skipping notification")
+        return
+    if send_notification_email(db, analysis) is False:
+        raise RuntimeError(f"Notification for analysis {analysis.id} was not sent")
+
+
+def _refresh_rollups_job(db: Session, payload: dict):
+    start_date, end_date = payload.get("start_date"), payload.get("end_date")
+    refresh_rollups(
+        db,
+        date.fromisoformat(start_date) if start_date else None,
+        date.fromisoformat(end_date) if end_date else None
+    )
+    bump_versions(db, "campaigns")
+    db.commit()
+
+
+# Job kind -> handler(db, payload); handlers raise to have the job retried
+JOB_HANDLERS = {
+    "run_analysis": _run_analysis_job,
+    "analyze_changed_series": _analyze_changed_series_job,
+    "notify_analysis": _notify_analysis_job,
+    "refresh_rollups": _refresh_rollups_job,
+}
+
+
+def enqueue_job(db: Session, kind: str, payload: Optional[dict] = None, dedupe_key: Optional[str] = None) -> Tuple[Job, bool]:
+    """
+    Queue a job and commit.
+
+    While a job with the same dedupe_key is pending or running, no new one is
+    created and that job is returned instead. Returns (job, created).
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+
+    table = Job.__table__
+    # The existing job may finish between the insert and the lookup; insert again then
+    for _ in range(3):
+        now = datetime.now(timezone.utc)
+        statement = dialect_insert(db, table).values(
+            kind=kind,
+            payload=payload or {},
+            dedupe_key=dedupe_key,
+            status=JOB_PENDING,
+            attempts=0,
+            max_attempts=settings.JOB_MAX_ATTEMPTS,
+            run_after=now,
+            created_at=now
+        )
+        if dedupe_key is not None:
+            statement = statement.on_conflict_do_nothing(
+                index_elements=[table.c.dedupe_key],
+                index_where=table.c.status.in_(ACTIVE_STATUSES)
+            )
+        job_id = db.execute(statement.returning(table.c.id)).scalar()
+        db.commit()
+
+        if job_id is not None:
+            logger.info(f"Queued {kind} job {job_id}")
+            return db.get(Job, job_id), True
+
+        job = db.query(Job).filter(Job.dedupe_key == dedupe_key, Job.status.in_(ACTIVE_STATUSES)).first()
+        if job is not None:
+            logger.info(f"{kind} job {job.id} is already {job.status}, not queueing another")
+            return job, False
+
+    raise RuntimeError(f"Could not queue {kind} job")
+
+
+def enqueue_analysis():
+    """Queue an analysis run unless one is already pending or running; used by the scheduler."""
+    db = SessionLocal()
+    try:
+        enqueue_job(db, "run_analysis", dedupe_key="run_analysis")
+    finally:
+        db.close()
+
+
+def enqueue_changed_series_analysis():
+    """Queue a micro-batch over the changed series once their marks are due; polled by the scheduler."""
+    db = SessionLocal()
+    try:
+        if changes_due(db):
+            enqueue_job(db, "analyze_changed_series", dedupe_key="analyze_changed_series")
+    finally:
+        db.close()
+
+
+def enqueue_rollup_backfill():
+    """Queue a full rollup build when campaigns exist but were never rolled up (e.g. loaded by init.sql)."""
+    db = SessionLocal()
+    try:
+        if db.query(CampaignRollup.id).first() is None and db.query(Campaign.id).first() is not None:
+            enqueue_job(db, "refresh_rollups", dedupe_key="refresh_rollups")
+    finally:
+        db.close()
+
+
+def claim_job(db: Session, worker_id: str) -> Optional[Job]:
+    """
+    Claim the next due job for worker_id, or return None.
+
+    The candidate row is selected with FOR UPDATE SKIP LOCKED so concurrent
+    workers never wait on each other, and taken with a conditional update so
+    two workers can't both claim it on backends without row locks. Running
+    jobs whose lease expired (no heartbeat; their worker died) are claimed
+    again.
+    """
+    now = datetime.now(timezone.utc)
+    lease_cutoff = now - timedelta(seconds=settings.JOB_LEASE_SECONDS)
+
+    # Jobs whose worker died on their last attempt won't be retried
+    db.execute(
+        update(Job)
+        .filter(Job.status == JOB_RUNNING, Job.heartbeat_at < lease_cutoff, Job.attempts >= Job.max_attempts)
+        .values(status=JOB_FAILED, finished_at=now, last_error="Lease expired on the last attempt")
+    )
+
+    claimable = or_(
+        and_(Job.status == JOB_PENDING, Job.run_after <= now),
+        and_(Job.status == JOB_RUNNING, Job.heartbeat_at < lease_cutoff)
+    )
+    job = db.query(Job).filter(claimable).order_by(Job.run_after, Job.id).limit(1).with_for_update(skip_locked=True).first()
+    if job is None:
+        db.commit()
+        return None
+
+    claimed = db.execute(
+        update(Job)
+        .filter(Job.id == job.id, Job.status == job.status, Job.attempts == job.attempts)
+        .values(
+            status=JOB_RUNNING, attempts=Job.attempts + 1, started_at=now, heartbeat_at=now,
+            finished_at=None, worker=worker_id
+        )
+    ).rowcount
+    db.commit()
+
+    if not claimed:
+        return None
+    db.refresh(job)
+    return job
+
+
+def run_next_job(worker_id: str) -> bool:
+    """Claim and execute one job; returns False when none was due."""
+    db = SessionLocal()
+    try:
+        job = claim_job(db, worker_id)
+        if job is None:
+            return False
+        job_id, kind, payload, attempts, max_attempts = job.id, job.kind, job.payload, job.attempts, job.max_attempts
+    finally:
+        db.close()
+
+    logger.info(f"Worker {worker_id} running {kind} job {job_id} (attempt {attempts})")
+    error = None
+    # Renew the lease while the handler runs, so long jobs aren't reclaimed
+    heartbeat = JobHeartbeat(job_id, worker_id, attempts)
+    heartbeat.start()
+    # Handlers get their own session, open for the whole job; objects stay
+    # loaded across its commits (an analysis run commits between phases)
+    db = SessionLocal(expire_on_commit=False)
+    try:
+        JOB_HANDLERS[kind](db, payload)
+    except Exception as e:
+        db.rollback()
+        error = f"{type(e).__name__}: {str(e)}"
+    finally:
+        db.close()
+        heartbeat.stop()
+
+    _finish_job(job_id, worker_id, attempts, max_attempts, error)
+    return True
+
+
+def _claim_filter(job_id: int, worker_id: str, attempts: int):
+    """Rows of a job still held by the claim worker_id made on attempt attempts."""
+    return and_(Job.id == job_id, Job.status == JOB_RUNNING, Job.worker == worker_id, Job.attempts == attempts)
+
+
+class JobHeartbeat(threading.Thread):
+    """Thread renewing a running job's lease every JOB_HEARTBEAT_SECONDS until stopped."""
+
+    def __init__(self, job_id: int, worker_id: str, attempts: int):
+        super().__init__(name=f"job-heartbeat-{job_id}", daemon=True)
+        self.job_id, self.worker_id, self.attempts = job_id, worker_id, attempts
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(settings.JOB_HEARTBEAT_SECONDS):
+            db = SessionLocal()
+            try:
+                renewed = db.execute(
+                    update(Job)
+                    .filter(_claim_filter(self.job_id, self.worker_id, self.attempts))
+                    .values(heartbeat_at=datetime.now(timezone.utc))
+                ).rowcount
+                db.commit()
+            except Exception as e:
+                logger.warning(f"Could not renew the lease of job {self.job_id}: {str(e)}")
+                continue
+            finally:
+                db.close()
+            if not renewed:
+                logger.warning(f"Job {self.job_id} was reclaimed from worker {self.worker_id}")
+                return
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _finish_job(job_id: int, worker_id: str, attempts: int, max_attempts: int, error: Optional[str]):
+    """
+    Record the outcome; failures are retried with exponential backoff until max_attempts.
+
+    Only recorded while this attempt still holds the job: a job reclaimed
+    after its lease expired belongs to the newer attempt.
+    """
+    now = datetime.now(timezone.utc)
+    if error is None:
+        values = {"status": JOB_SUCCEEDED, "finished_at": now, "last_error": None}
+        logger.info(f"Job {job_id} succeeded")
+    elif attempts < max_attempts:
+        delay = settings.JOB_RETRY_BACKOFF * 2 ** (attempts - 1)
+        values = {"status": JOB_PENDING, "run_after": now + timedelta(seconds=delay), "last_error": error}
+        logger.warning(f"Job {job_id} failed (attempt {attempts}), retrying in {delay:g}s: {error}")
+    else:
+        values = {"status": JOB_FAILED, "finished_at": now, "last_error": error}
+        logger.error(f"Job {job_id} failed after {attempts} attempts: {error}")
+
+    db = SessionLocal()
+    try:
+        recorded = db.execute(update(Job).filter(_claim_filter(job_id, worker_id, attempts)).values(**values)).rowcount
+        db.commit()
+    finally:
+        db.close()
+    if not recorded:
+        logger.warning(f"Job {job_id} was reclaimed after attempt {attempts}, not recording its outcome")
+
+
+class JobWorker(threading.Thread):
+    """Thread that keeps claiming and running jobs until stopped."""
+
+    def __init__(self, index: int):
+        super().__init__(name=f"job-worker-{index}", daemon=True)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                worked = run_next_job(self.worker_id)
+            except Exception as e:
+                logger.error(f"Error in job worker {self.worker_id}: {str(e)}")
+                worked = False
+            if not worked:
+                self._stop_event.wait(settings.JOB_POLL_INTERVAL)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def start_workers(count: int) -> List[JobWorker]:
+    workers = [JobWorker(index) for index in range(count)]
+    for worker in workers:
+        worker.start()
+    if workers:
+        logger.info(f"Started {len(workers)} job workers")
+    return workers
+
+
+def stop_workers(workers: List[JobWorker], timeout: float = 5.0):
+    """Ask workers to stop and wait briefly; a job still running is reclaimed after its lease."""
+    for worker in workers:
+        worker.stop()
+    for worker in workers:
+        worker.join(timeout)
+
+
+if __name__ == "__main__":
+    # Standalone worker process: python -m app.services.job_queue
+    logging.basicConfig(level=logging.INFO)
+    workers = start_workers(max(1, settings.JOB_WORKERS))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop_workers(workers)
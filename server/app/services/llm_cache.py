@@ -0,0 +1,188 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func, delete, update, select
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+import hashlib
+import json
+import threading
+import time
+import logging
+
+from app.core.config import settings
+from app.db.database import dialect_insert
+from app.db.models import Analysis, LLMCacheEntry
+
+logger = logging.getLogger(__name__)
+
+
+def fingerprint(analysis: Analysis) -> str:
+    """
+    Normalized key of the prompt inputs that shape a recommendation.
+
+    Type, metric, series and severity are taken as is; the relative change
+    from the expected value is bucketed, so recurring anomalies of similar
+    size share an entry.
+    """
+    change_bucket = None
+    if analysis.value is not None and analysis.expected_value:
+        percent_change = (analysis.value - analysis.expected_value) / analysis.expected_value * 100
+        change_bucket = int(percent_change // settings.LLM_CACHE_CHANGE_BUCKET)
+
+    key = [
+        analysis.type,
+        analysis.metric,
+        analysis.campaign_name,
+        analysis.platform,
+        analysis.region,
+        analysis.severity,
+        change_bucket
+    ]
+    return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+
+class LLMCache:
+    """
+    Two-tier cache of completion texts by fingerprint.
+
+    An in-process LRU answers repeats without a query; the llm_cache_entries
+    table shares results across workers and restarts. Both tiers expire
+    entries after LLM_CACHE_TTL_SECONDS and evict least recently used ones
+    beyond their size limits.
+    """
+
+    def __init__(self, memory_size: int, max_rows: int, ttl_seconds: int):
+        self.memory_size = memory_size
+        self.max_rows = max_rows
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # fingerprint -> (content, stored_at)
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_many(self, db: Session, fingerprints: List[str]) -> Dict[str, str]:
+        """
+        Look fingerprints up in memory, then in one query against the table.
+
+        Hit bookkeeping on the table joins the caller's transaction.
+        """
+        found = {}
+        now = time.time()
+        with self._lock:
+            for key in fingerprints:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                content, stored_at = entry
+                if now - stored_at > self.ttl_seconds:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = content
+            self.memory_hits += len(found)
+
+        remaining = [key for key in dict.fromkeys(fingerprints) if key not in found]
+        if remaining:
+            rows = db.execute(
+                select(LLMCacheEntry.fingerprint, LLMCacheEntry.content, LLMCacheEntry.created_at).filter(
+                    LLMCacheEntry.fingerprint.in_(remaining),
+                    LLMCacheEntry.created_at >= self._cutoff()
+                )
+            ).all()
+
+            if rows:
+                db.execute(
+                    update(LLMCacheEntry)
+                    .filter(LLMCacheEntry.fingerprint.in_([row.fingerprint for row in rows]))
+                    .values(last_used_at=datetime.now(timezone.utc), hits=LLMCacheEntry.hits + 1)
+                )
+
+            for row in rows:
+                found[row.fingerprint] = row.content
+                self._remember(row.fingerprint, row.content, _timestamp(row.created_at))
+
+            with self._lock:
+                self.db_hits += len(rows)
+                self.misses += len(remaining) - len(rows)
+
+        return found
+
+    def put_many(self, db: Session, contents: Dict[str, str]):
+        """Store new completions in both tiers; the table write joins the caller's transaction."""
+        if not contents:
+            return
+
+        now = datetime.now(timezone.utc)
+        rows = [
+            {"fingerprint": key, "content": content, "created_at": now, "last_used_at": now, "hits": 0}
+            for key, content in contents.items()
+        ]
+        statement = dialect_insert(db, LLMCacheEntry.__table__)
+        statement = statement.on_conflict_do_update(
+            index_elements=[LLMCacheEntry.__table__.c.fingerprint],
+            set_={
+                "content": statement.excluded.content,
+                "created_at": statement.excluded.created_at,
+                "last_used_at": statement.excluded.last_used_at
+            }
+        )
+        db.execute(statement, rows)
+        self._evict_rows(db)
+
+        for key, content in contents.items():
+            self._remember(key, content, now.timestamp())
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.db_hits + self.misses
+            return {
+                "memory_entries": len(self._entries),
+                "memory_hits": self.memory_hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.db_hits) / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def clear_memory(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _remember(self, key: str, content: str, stored_at: float):
+        with self._lock:
+            self._entries[key] = (content, stored_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.memory_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _evict_rows(self, db: Session):
+        """Drop expired rows, then the least recently used ones beyond max_rows."""
+        expired = db.execute(delete(LLMCacheEntry).filter(LLMCacheEntry.created_at < self._cutoff())).rowcount
+
+        excess = db.query(func.count(LLMCacheEntry.id)).scalar() - self.max_rows
+        if excess > 0:
+            oldest = select(LLMCacheEntry.id).order_by(LLMCacheEntry.last_used_at, LLMCacheEntry.id).limit(excess)
+            db.execute(delete(LLMCacheEntry).filter(LLMCacheEntry.id.in_(oldest)))
+
+        with self._lock:
+            self.evictions += (expired or 0) + max(excess, 0)
+
+    def _cutoff(self) -> datetime:
+        return datetime.now(timezone.utc) - timedelta(seconds=self.ttl_seconds)
+
+
+def _timestamp(value: datetime) -> float:
+    # SQLite hands timestamps back without a timezone; they were written in UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+llm_cache = LLMCache(
+    settings.LLM_CACHE_MEMORY_SIZE,
+    settings.LLM_CACHE_MAX_ROWS,
+    settings.LLM_CACHE_TTL_SECONDS
+)
@@ -2,58 +2,283 @@ import httpx
 import json
 import logging
 import asyncio
-from datetime import datetime, timedelta
+import random
+import threading
+import time
+from contextlib import asynccontextmanager
 from sqlalchemy.orm import Session
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Union
+from datetime import timedelta
 from app.db.models import Analysis, Recommendation, Campaign
 from app.core.config import settings
+from app.core.metrics import llm_request_duration, llm_requests
+from app.services.llm_cache import llm_cache, fingerprint
+from app.services.response_cache import bump_versions
 
 logger = logging.getLogger(__name__)
 
-MISTRAL_API_URL = "https://api.mistral.ai/v1/chat/completions"
+MISTRAL_MODEL = "mistral-small-latest"
+MAX_COMPLETION_TOKENS = 500
 
-# Simple in-memory rate limiter
-last_api_call = datetime.min
-min_call_interval = timedelta(seconds=2)  # Wait at least 2 seconds between calls
+# Rough token estimate for prompt text
+CHARS_PER_TOKEN = 4
 
-async def generate_recommendation(db: Session, analysis: Analysis):
+
+class TokenBucket:
+    """
+    Token bucket refilled at `rate` tokens per second, up to `capacity`.
+
+    The bucket is shared by every event loop and thread in the process (the
+    API loop and scheduled runs alike); waiting happens outside the lock.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    async def acquire(self, amount: float = 1.0):
+        # A request larger than the bucket could never be served otherwise
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            await asyncio.sleep(wait)
+
+
+# Rate limits of the completion API: requests per second and tokens per minute
+request_bucket = TokenBucket(settings.LLM_REQUESTS_PER_SECOND, max(1.0, settings.LLM_REQUESTS_PER_SECOND))
+token_bucket = TokenBucket(settings.LLM_TOKENS_PER_MINUTE / 60, settings.LLM_TOKENS_PER_MINUTE)
+
+# Keep-alive client for the API's event loop, opened and closed by the app lifespan
+_shared_client: Optional[httpx.AsyncClient] = None
+_shared_client_loop = None
+
+
+def _new_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=settings.LLM_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=settings.LLM_MAX_CONCURRENCY,
+            max_keepalive_connections=settings.LLM_MAX_CONCURRENCY
+        ),
+        headers={
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {settings.MISTRAL_API_KEY}"
+        }
+    )
+
+
+async def open_shared_client():
+    """Create the keep-alive client used by requests on the current event loop."""
+    global _shared_client, _shared_client_loop
+    _shared_client = _new_client()
+    _shared_client_loop = asyncio.get_running_loop()
+
+
+async def close_shared_client():
+    global _shared_client, _shared_client_loop
+    if _shared_client is not None:
+        await _shared_client.aclose()
+    _shared_client = None
+    _shared_client_loop = None
+
+
+@asynccontextmanager
+async def _client_for_current_loop():
+    """The shared client when running on its loop, otherwise one client for the whole batch."""
+    if _shared_client is not None and _shared_client_loop is asyncio.get_running_loop():
+        yield _shared_client
+    else:
+        async with _new_client() as client:
+            yield client
+
+
+async def generate_recommendation(db: Union[Session, AsyncSession], analysis: Analysis):
     """Generate recommendation for an analysis using Mistral API."""
-    global last_api_call
+    recommendations = await generate_recommendations(db, [analysis])
+    return recommendations[0] if recommendations else None
+
+
+async def generate_recommendations(db: Union[Session, AsyncSession], analyses: List[Analysis]) -> List[Recommendation]:
+    """
+    Generate recommendations for a batch of analyses.
+
+    Analyses of the same series are packed, whatever their dates, up to
+    LLM_BATCH_SIZE and LLM_BATCH_TOKEN_BUDGET, into one completion answered
+    as JSON keyed by analysis id; entries missing from the answer fall back
+    to one call each. Completion calls run concurrently (at most
+    LLM_MAX_CONCURRENCY at a time) behind the shared rate limits, reuse one
+    keep-alive client and retry with backoff on 429/5xx. Analyses whose
+    fingerprint is cached skip the call.
+    Successful results are saved in a single commit; analyses whose call
+    failed get no recommendation.
+    """
+    if not analyses:
+        return []
+
+    try:
+        # Serve recurring anomalies from the cache; only the rest go to the API
+        keys = [fingerprint(analysis) for analysis in analyses]
+        contents = await _run_db(db, llm_cache.get_many, keys) if settings.LLM_CACHE_ENABLED else {}
+
+        # Identical fingerprints within the batch share one call
+        pending = {}
+        for analysis, key in zip(analyses, keys):
+            if key not in contents:
+                pending.setdefault(key, analysis)
+
+        fresh = {}
+        if pending:
+            # Get campaign data once per batch of analyses sharing it
+            batches = _plan_batches(pending)
+            contexts = [
+                await _run_db(db, _load_campaign_summary, [analysis for _, analysis in batch]) for batch in batches
+            ]
+
+            semaphore = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+            async with _client_for_current_loop() as client:
+                completed = await asyncio.gather(*[
+                    _complete_batch(client, semaphore, batch, context)
+                    for batch, context in zip(batches, contexts)
+                ])
+            for texts in completed:
+                fresh.update(texts)
+            contents.update(fresh)
+
+        results = [(analysis, contents[key]) for analysis, key in zip(analyses, keys) if key in contents]
+        if len(results) < len(analyses):
+            logger.warning(f"Failed to generate {len(analyses) - len(results)} of {len(analyses)} recommendations")
+
+        # Save recommendations to database
+        return await _run_db(db, _save_recommendations, results, fresh)
+
+    except Exception as e:
+        logger.error(f"Error generating recommendations: {str(e)}")
+        return []
+
+
+def _plan_batches(pending: dict) -> List[list]:
+    """
+    Split (fingerprint, analysis) pairs into batches that share a prompt context.
+
+    Analyses of one series (e.g. its anomalies on different days of a run)
+    share campaign data spanning their dates, so they are grouped together,
+    in chunks of LLM_BATCH_SIZE that stay within LLM_BATCH_TOKEN_BUDGET.
+    """
+    groups = {}
+    for key, analysis in pending.items():
+        groups.setdefault((analysis.campaign_name, analysis.platform, analysis.region), []).append((key, analysis))
+
+    batches = []
+    for items in groups.values():
+        batch, tokens = [], settings.LLM_CONTEXT_TOKENS
+        for key, analysis in items:
+            cost = len(_dump_context(_describe(analysis))) / CHARS_PER_TOKEN + MAX_COMPLETION_TOKENS
+            if batch and (len(batch) >= settings.LLM_BATCH_SIZE or tokens + cost > settings.LLM_BATCH_TOKEN_BUDGET):
+                batches.append(batch)
+                batch, tokens = [], settings.LLM_CONTEXT_TOKENS
+            batch.append((key, analysis))
+            tokens += cost
+        batches.append(batch)
 
+    return batches
+
+
+async def _complete_batch(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, batch: list, campaign_summary) -> dict:
+    """Complete one batch, returning texts by fingerprint; unparsed entries are retried one by one."""
+    texts = {}
+    if len(batch) > 1:
+        text = await _complete(
+            client, semaphore, _build_batch_prompt([analysis for _, analysis in batch], campaign_summary),
+            json_output=True, max_tokens=MAX_COMPLETION_TOKENS * len(batch)
+        )
+        texts = _split_batch_response(text, batch)
+        if len(texts) < len(batch):
+            logger.warning(f"Batched completion answered {len(texts)} of {len(batch)} analyses, falling back to single calls")
+
+    remaining = [(key, analysis) for key, analysis in batch if key not in texts]
+    singles = await asyncio.gather(*[
+        _complete(client, semaphore, _build_prompt(analysis, campaign_summary))
+        for _, analysis in remaining
+    ])
+    for (key, _), text in zip(remaining, singles):
+        if text is not None:
+            texts[key] = text
+
+    return texts
+
+
+def _split_batch_response(text: Optional[str], batch: list) -> dict:
+    """Pick each analysis' recommendations out of a JSON answer keyed by analysis id."""
+    if text is None:
+        return {}
     try:
-        # Rate limiting
-        now = datetime.now()
-        time_since_last_call = now - last_api_call
-        if time_since_last_call < min_call_interval:
-            sleep_time = (min_call_interval - time_since_last_call).total_seconds()
-            logger.info(f"Rate limiting: Waiting {sleep_time:.2f} seconds before API call")
-            await asyncio.sleep(sleep_time)
-
-        # Get campaign data related to the analysis
-        campaigns = db.query(Campaign).filter(
-            Campaign.date.between(analysis.date_range_start, analysis.date_range_end)
-        ).all()
-
-        # Prepare campaign data summary for context
-        campaign_summary = []
-        for campaign in campaigns:
-            campaign_summary.append({
-                "name": campaign.campaign_name,
-                "platform": campaign.platform,
-                "region": campaign.region,
-                "date": str(campaign.date),
-                "impressions": campaign.impressions,
-                "clicks": campaign.clicks,
-                "conversions": campaign.conversions,
-                "spend": campaign.spend,
-                "ctr": campaign.ctr,
-                "cpc": campaign.cpc,
-                "cpa": campaign.cpa
-            })
-
-        # Create prompt for the LLM
-        prompt = f"""
+        answers = json.loads(text)
+    except ValueError:
+        logger.warning("Batched completion was not valid JSON")
+        return {}
+    if not isinstance(answers, dict):
+        return {}
+
+    texts = {}
+    for key, analysis in batch:
+        answer = answers.get(str(analysis.id))
+        if isinstance(answer, list):
+            answer = "\n\n".join(str(item) for item in answer)
+        if isinstance(answer, str) and answer.strip():
+            texts[key] = answer.strip()
+    return texts
+
+
+def _describe(analysis: Analysis) -> dict:
+    return {
+        "id": analysis.id,
+        "type": analysis.type,
+        "metric": analysis.metric,
+        "description": analysis.description,
+        "severity": analysis.severity,
+        "current_value": analysis.value,
+        "expected_value": analysis.expected_value,
+        "date_range": f"{analysis.date_range_start} to {analysis.date_range_end}"
+    }
+
+
+def _build_batch_prompt(analyses: List[Analysis], campaign_summary) -> str:
+    """Create one prompt covering several analyses of the same campaign data."""
+    return f"""
+        You are a marketing analytics expert. Based on the following analyses and campaign data, provide actionable recommendations for each analysis.
+
+        ANALYSES:
+        {_dump_context([_describe(analysis) for analysis in analyses])}
+
+        CAMPAIGN DATA:
+        {_dump_context(campaign_summary)}
+
+        Provide 3 specific, actionable recommendations to address each issue. Each recommendation should:
+        1. Be specific to the platform, campaign, and region involved
+        2. Suggest a concrete action to take
+        3. Explain the expected outcome of taking this action
+
+        Respond with a JSON object mapping each analysis id (as a string) to a single string holding its 3 recommendations, written as separate paragraphs without numbering or bullet points.
+        """
+
+
+def _build_prompt(analysis: Analysis, campaign_summary) -> str:
+    """Create prompt for the LLM."""
+    return f"""
         You are a marketing analytics expert. Based on the following analysis and campaign data, provide actionable recommendations.
-        
+
         ANALYSIS:
         Type: {analysis.type}
         Metric: {analysis.metric}
@@ -62,59 +287,202 @@ async def generate_recommendation(db: Session, analysis: Analysis):
         Current Value: {analysis.value}
         Expected Value: {analysis.expected_value}
         Date Range: {analysis.date_range_start} to {analysis.date_range_end}
-        
+
         CAMPAIGN DATA:
-        {json.dumps(campaign_summary, indent=2)}
-        
+        {_dump_context(campaign_summary)}
+
         Provide 3 specific, actionable recommendations to address this issue. Each recommendation should:
         1. Be specific to the platform, campaign, and region involved
         2. Suggest a concrete action to take
         3. Explain the expected outcome of taking this action
-        
+
         Format your response as 3 separate recommendations without numbering or bullet points.
         """
 
-        # Call Mistral API
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {settings.MISTRAL_API_KEY}"
-        }
 
-        payload = {
-            "model": "mistral-small-latest",
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.7,
-            "max_tokens": 500
-        }
+async def _complete(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, prompt: str,
+                    json_output: bool = False, max_tokens: int = MAX_COMPLETION_TOKENS) -> Optional[str]:
+    """Call the completion API for one prompt, retrying rate limits and server errors."""
+    payload = {
+        "model": MISTRAL_MODEL,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.7,
+        "max_tokens": max_tokens
+    }
+    if json_output:
+        payload["response_format"] = {"type": "json_object"}
+    # Rough token estimate for the tokens/minute limit
+    estimated_tokens = len(prompt) / CHARS_PER_TOKEN + max_tokens
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                MISTRAL_API_URL,
-                headers=headers,
-                json=payload
-            )
-
-            # Update last API call timestamp after making the request
-            last_api_call = datetime.now()
-
-            if response.status_code == 200:
-                response_data = response.json()
-                recommendation_text = response_data["choices"][0]["message"]["content"]
-
-                # Save recommendation to database
-                recommendation = Recommendation(
-                    analysis_id=analysis.id,
-                    content=recommendation_text
-                )
-                db.add(recommendation)
-                db.commit()
-                db.refresh(recommendation)
-
-                return recommendation
-            else:
-                logger.error(f"Error from Mistral API: {response.text}")
+    async with semaphore:
+        for attempt in range(settings.LLM_MAX_RETRIES + 1):
+            await request_bucket.acquire()
+            await token_bucket.acquire(estimated_tokens)
+
+            retry_after = None
+            started = time.perf_counter()
+            try:
+                response = await client.post(settings.MISTRAL_API_URL, json=payload)
+            except (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError) as e:
+                _record_attempt(started, "transport_error")
+                logger.warning(f"Mistral API request failed (attempt {attempt + 1}): {str(e)}")
+            except httpx.HTTPError as e:
+                _record_attempt(started, "error")
+                logger.error(f"Error calling Mistral API: {str(e)}")
                 return None
+            else:
+                if response.status_code == 200:
+                    _record_attempt(started, "success")
+                    return response.json()["choices"][0]["message"]["content"]
+                if response.status_code != 429 and response.status_code < 500:
+                    _record_attempt(started, "client_error")
+                    logger.error(f"Error from Mistral API: {response.text}")
+                    return None
+                _record_attempt(started, "rate_limited" if response.status_code == 429 else "server_error")
+                logger.warning(f"Mistral API returned {response.status_code} (attempt {attempt + 1})")
+                retry_after = _retry_after_seconds(response)
 
-    except Exception as e:
-        logger.error(f"Error generating recommendation: {str(e)}")
-        return None
\ No newline at end of file
+            if attempt < settings.LLM_MAX_RETRIES:
+                # Exponential backoff with jitter, unless the API says how long to wait
+                delay = retry_after if retry_after is not None else settings.LLM_RETRY_BACKOFF * 2 ** attempt
+                await asyncio.sleep(delay * random.uniform(1.0, 1.25))
+
+    logger.error(f"Giving up on Mistral API call after {settings.LLM_MAX_RETRIES + 1} attempts")
+    return None
+
+
+def _record_attempt(started: float, outcome: str):
+    llm_request_duration.observe(time.perf_counter() - started, outcome=outcome)
+    llm_requests.inc(outcome=outcome)
+
+
+def _retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+async def _run_db(db: Union[Session, AsyncSession], fn, *args):
+    """Run a sync DB helper against either session type without blocking the event loop on async ones."""
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args)
+    return fn(db, *args)
+
+
+def _load_campaign_summary(db: Session, analyses: List[Analysis]):
+    """
+    Collect the prompt context shared by analyses of one series.
+
+    The context spans the union of their date ranges. Only the series itself
+    is read row by row; its trailing averages and the averages of its peers
+    (same platform and region) are aggregated in SQL. Daily rows are
+    trimmed, oldest first, to fit LLM_CONTEXT_TOKENS.
+    """
+    analysis = analyses[0]
+    start_date = min(item.date_range_start for item in analyses)
+    end_date = max(item.date_range_end for item in analyses)
+
+    if analysis.campaign_name is None:
+        # Findings without a series key only get the aggregates of the range,
+        # within the platform and region of aggregate anomalies
+        scope = {"platform": analysis.platform, "region": analysis.region}
+        scope = {dimension: value for dimension, value in scope.items() if value is not None}
+        return {**scope, "all_campaigns": _metric_averages(db, [
+            *[getattr(Campaign, dimension) == value for dimension, value in scope.items()],
+            Campaign.date.between(start_date, end_date)
+        ])}
+
+    series = [
+        Campaign.campaign_name == analysis.campaign_name,
+        Campaign.platform == analysis.platform,
+        Campaign.region == analysis.region
+    ]
+    rows = db.query(
+        Campaign.date, Campaign.impressions, Campaign.clicks, Campaign.conversions,
+        Campaign.spend, Campaign.ctr, Campaign.cpc, Campaign.cpa
+    ).filter(
+        *series,
+        Campaign.date.between(start_date, end_date)
+    ).order_by(Campaign.date).all()
+
+    trailing_start = end_date - timedelta(days=settings.LLM_CONTEXT_TRAILING_DAYS)
+
+    # Prepare campaign data summary for context
+    campaign_summary = {
+        "campaign": analysis.campaign_name,
+        "platform": analysis.platform,
+        "region": analysis.region,
+        f"trailing_{settings.LLM_CONTEXT_TRAILING_DAYS}_day_averages": _metric_averages(db, [
+            *series,
+            Campaign.date.between(trailing_start, end_date)
+        ]),
+        "peer_averages": _metric_averages(db, [
+            Campaign.platform == analysis.platform,
+            Campaign.region == analysis.region,
+            Campaign.campaign_name != analysis.campaign_name,
+            Campaign.date.between(start_date, end_date)
+        ]),
+        "daily": [
+            {
+                "date": str(row.date),
+                "impressions": row.impressions,
+                "clicks": row.clicks,
+                "conversions": row.conversions,
+                "spend": row.spend,
+                "ctr": _round(row.ctr),
+                "cpc": _round(row.cpc),
+                "cpa": _round(row.cpa)
+            }
+            for row in rows
+        ]
+    }
+
+    # Keep the most recent days that fit the budget
+    budget = settings.LLM_CONTEXT_TOKENS * CHARS_PER_TOKEN
+    while campaign_summary["daily"] and len(_dump_context(campaign_summary)) > budget:
+        campaign_summary["daily"].pop(0)
+
+    return campaign_summary
+
+
+def _metric_averages(db: Session, filters) -> dict:
+    """Average the metrics and count the rows matching filters, in one query."""
+    row = db.query(
+        func.count(Campaign.id).label("days"),
+        func.avg(Campaign.impressions).label("impressions"),
+        func.avg(Campaign.clicks).label("clicks"),
+        func.avg(Campaign.conversions).label("conversions"),
+        func.avg(Campaign.spend).label("spend"),
+        func.avg(Campaign.ctr).label("ctr"),
+        func.avg(Campaign.cpc).label("cpc"),
+        func.avg(Campaign.cpa).label("cpa")
+    ).filter(*filters).one()
+    averages = {key: _round(value) for key, value in row._mapping.items()}
+    averages["days"] = row.days
+    return averages
+
+
+def _round(value):
+    return round(float(value), 4) if value is not None else None
+
+
+def _dump_context(campaign_summary) -> str:
+    return json.dumps(campaign_summary, separators=(",", ":"), default=str)
+
+
+def _save_recommendations(db: Session, results, fresh):
+    """Persist (analysis, content) pairs as recommendations, and fresh completions in the cache, in one commit."""
+    recommendations = [
+        Recommendation(analysis_id=analysis.id, content=content)
+        for analysis, content in results
+    ]
+    if fresh and settings.LLM_CACHE_ENABLED:
+        llm_cache.put_many(db, fresh)
+    if recommendations:
+        db.add_all(recommendations)
+        bump_versions(db, "recommendations")
+    if recommendations or fresh:
+        db.commit()
+
+    return recommendations
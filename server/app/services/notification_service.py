@@ -1,119 +1,246 @@
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from typing import List, Optional
 import logging
+import time
 from sqlalchemy.orm import Session
 from app.db.models import Analysis, Notification, Recommendation
 from app.core.config import settings
+from app.core.metrics import smtp_send_duration, smtp_sends
+from app.services.response_cache import bump_versions
 
 logger = logging.getLogger(__name__)
 
+EMAIL_STYLE = """
+                body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
+                .container { max-width: 600px; margin: 0 auto; padding: 20px; }
+                .header { background-color: #f8f9fa; padding: 15px; border-radius: 5px; }
+                .severity-high { color: #dc3545; font-weight: bold; }
+                .severity-medium { color: #fd7e14; font-weight: bold; }
+                .severity-low { color: #20c997; font-weight: bold; }
+                .metric { font-weight: bold; }
+                .value { font-family: monospace; }
+                .recommendations { margin-top: 20px; }
+                .recommendation { margin-bottom: 15px; padding: 10px; background-color: #f8f9fa; border-left: 4px solid #007bff; }
+                .action-link { display: inline-block; margin-top: 15px; padding: 10px 15px; background-color: #007bff; color: white; text-decoration: none; border-radius: 4px; }
+                .analysis { margin-bottom: 30px; padding-bottom: 15px; border-bottom: 1px solid #dee2e6; }
+"""
+
+
+class SMTPDispatcher:
+    """
+    One authenticated SMTP connection reused for a batch of messages.
+
+    The connection is opened lazily on the first send and reopened once if
+    the server drops it mid-batch.
+    """
+
+    def __init__(self):
+        self._server: Optional[smtplib.SMTP] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def send(self, msg: MIMEMultipart):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            try:
+                self._connect().send_message(msg)
+            except smtplib.SMTPServerDisconnected:
+                self._server = None
+                self._connect().send_message(msg)
+            outcome = "success"
+        finally:
+            smtp_send_duration.observe(time.perf_counter() - started, outcome=outcome)
+            smtp_sends.inc(outcome=outcome)
+
+    def close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except smtplib.SMTPException:
+                pass
+            self._server = None
+
+    def _connect(self) -> smtplib.SMTP:
+        if self._server is None:
+            server = smtplib.SMTP(settings.SMTP_SERVER, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT)
+            if settings.SMTP_USER and settings.SMTP_PASSWORD:
+                server.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
+            self._server = server
+        return self._server
+
+
 def send_notification_email(db: Session, analysis: Analysis):
     """Send email notification for an important analysis finding."""
+    # Check if notification already sent
+    if analysis.notified:
+        logger.info(f"Notification already sent for analysis {analysis.id}")
+        return
+
+    return send_notifications(db, [analysis], digest=False) == 1
+
+
+def send_notifications(db: Session, analyses: List[Analysis], digest: Optional[bool] = None) -> int:
+    """
+    Notify every recipient about a batch of analyses over one SMTP connection.
+
+    In digest mode (NOTIFICATION_DIGEST by default) each recipient gets a
+    single email covering all analyses; otherwise one email per analysis.
+    Notification rows are still recorded per analysis and recipient, and are
+    saved together with the notified flags in one commit; a digest's rows
+    keep its subject and only their analysis' section of the body. Returns
+    the number of analyses notified.
+    """
+    if digest is None:
+        digest = settings.NOTIFICATION_DIGEST
+
+    analyses = [analysis for analysis in analyses if not analysis.notified]
+    if not analyses:
+        return 0
+
     try:
-        # Check if notification already sent
-        if analysis.notified:
-            logger.info(f"Notification already sent for analysis {analysis.id}")
-            return
+        # Get recommendations for the whole batch in one query
+        recommendations = {}
+        for recommendation in db.query(Recommendation).filter(
+            Recommendation.analysis_id.in_([analysis.id for analysis in analyses])
+        ).order_by(Recommendation.id):
+            recommendations.setdefault(recommendation.analysis_id, []).append(recommendation)
+
+        # (subject, body, content recorded per covered analysis id)
+        if digest:
+            messages = [_render_digest(analyses, recommendations)]
+        else:
+            messages = []
+            for analysis in analyses:
+                subject, content = _render_single(analysis, recommendations.get(analysis.id, []))
+                messages.append((subject, content, {analysis.id: content}))
+
+        notifications = []
+        notified = set()
+        with SMTPDispatcher() as dispatcher:
+            for recipient in settings.get_notification_recipients:
+                for subject, content, records in messages:
+                    try:
+                        dispatcher.send(_build_message(recipient, subject, content))
+                    except (smtplib.SMTPException, OSError) as e:
+                        logger.error(f"Error sending notification to {recipient}: {str(e)}")
+                        continue
+
+                    for analysis_id, record in records.items():
+                        notified.add(analysis_id)
+                        notifications.append(Notification(
+                            analysis_id=analysis_id,
+                            recipient=recipient,
+                            subject=subject,
+                            content=record
+                        ))
+
+        # Mark as notified and record notifications in one commit
+        for analysis in analyses:
+            if analysis.id in notified:
+                analysis.notified = True
+        if notifications:
+            db.add_all(notifications)
+            bump_versions(db, "analyses")
+            db.commit()
+
+        logger.info(f"Notifications sent for {len(notified)} of {len(analyses)} analyses ({len(notifications)} records)")
+        return len(notified)
+
+    except Exception as e:
+        logger.error(f"Error sending notifications: {str(e)}")
+        return 0
+
+
+def _build_message(recipient: str, subject: str, content: str) -> MIMEMultipart:
+    msg = MIMEMultipart()
+    msg["From"] = settings.EMAILS_FROM_EMAIL
+    msg["To"] = recipient
+    msg["Subject"] = subject
+
+    # Attach HTML content
+    msg.attach(MIMEText(content, "html"))
+    return msg
 
-        # Get recommendations if any
-        recommendations = db.query(Recommendation).filter(
-            Recommendation.analysis_id == analysis.id
-        ).all()
 
-        # Create email subject and content
-        subject = f"Marketing Alert: {analysis.severity.upper()} {analysis.type} in {analysis.metric}"
+def _render_single(analysis: Analysis, recommendations: List[Recommendation]):
+    """Subject and HTML body of the email for one analysis."""
+    subject = f"Marketing Alert: {analysis.severity.upper()} {analysis.type} in {analysis.metric}"
+    header = f"""<p>We've detected a <span class="severity-{analysis.severity}">{analysis.severity}</span> {analysis.type} that requires your attention.</p>"""
+    body = _render_analysis(analysis, recommendations) + f"""
+                <a href="http://localhost:3000/analysis/{analysis.id}" class="action-link">View Details in Dashboard</a>
+        """
+    return subject, _render_page(header, body)
+
+
+def _render_digest(analyses: List[Analysis], recommendations: dict):
+    """Subject and HTML body of one email covering a run's analyses, plus each analysis' section of it."""
+    high = sum(1 for analysis in analyses if analysis.severity == "high")
+    subject = f"Marketing Alert Digest: {len(analyses)} findings ({high} high severity)"
+    header = f"""<p>We've detected {len(analyses)} findings that require your attention.</p>"""
+    sections = {
+        analysis.id: f"""
+                <div class="analysis">
+                    {_render_analysis(analysis, recommendations.get(analysis.id, []))}
+                    <a href="http://localhost:3000/analysis/{analysis.id}" class="action-link">View Details in Dashboard</a>
+                </div>
+        """
+        for analysis in analyses
+    }
+    return subject, _render_page(header, "".join(sections.values())), sections
 
-        # Create email content
-        content = f"""
+
+def _render_page(header: str, body: str) -> str:
+    return f"""
         <html>
         <head>
-            <style>
-                body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-                .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-                .header {{ background-color: #f8f9fa; padding: 15px; border-radius: 5px; }}
-                .severity-high {{ color: #dc3545; font-weight: bold; }}
-                .severity-medium {{ color: #fd7e14; font-weight: bold; }}
-                .severity-low {{ color: #20c997; font-weight: bold; }}
-                .metric {{ font-weight: bold; }}
-                .value {{ font-family: monospace; }}
-                .recommendations {{ margin-top: 20px; }}
-                .recommendation {{ margin-bottom: 15px; padding: 10px; background-color: #f8f9fa; border-left: 4px solid #007bff; }}
-                .action-link {{ display: inline-block; margin-top: 15px; padding: 10px 15px; background-color: #007bff; color: white; text-decoration: none; border-radius: 4px; }}
-            </style>
+            <style>{EMAIL_STYLE}</style>
         </head>
         <body>
             <div class="container">
                 <div class="header">
                     <h2>Marketing Campaign Alert</h2>
-                    <p>We've detected a <span class="severity-{analysis.severity}">{analysis.severity}</span> {analysis.type} that requires your attention.</p>
+                    {header}
                 </div>
-                
+                {body}
+            </div>
+        </body>
+        </html>
+        """
+
+
+def _render_analysis(analysis: Analysis, recommendations: List[Recommendation]) -> str:
+    """Details and recommendations of one analysis."""
+    content = f"""
                 <h3>Analysis Details</h3>
                 <p><strong>Description:</strong> {analysis.description}</p>
                 <p><strong>Metric:</strong> <span class="metric">{analysis.metric}</span></p>
                 <p><strong>Current Value:</strong> <span class="value">{analysis.value:.4f}</span></p>
                 <p><strong>Expected Value:</strong> <span class="value">{analysis.expected_value:.4f}</span></p>
                 <p><strong>Date Range:</strong> {analysis.date_range_start} to {analysis.date_range_end}</p>
-                
+
                 <div class="recommendations">
                     <h3>Recommendations</h3>
         """
 
-        if recommendations:
-            for recommendation in recommendations:
-                content += f"""
+    if recommendations:
+        for recommendation in recommendations:
+            content += f"""
                     <div class="recommendation">
                         <p>{recommendation.content}</p>
                     </div>
                 """
-        else:
-            content += """
+    else:
+        content += """
                     <p>Recommendations are being generated and will be available on the dashboard.</p>
             """
 
-        # Add link to dashboard
-        content += f"""
+    return content + """
                 </div>
-                
-                <a href="http://localhost:3000/analysis/{analysis.id}" class="action-link">View Details in Dashboard</a>
-            </div>
-        </body>
-        </html>
         """
-
-        # Create email message
-        msg = MIMEMultipart()
-        msg["From"] = settings.EMAILS_FROM_EMAIL
-        msg["To"] = settings.EMAILS_TO_EMAIL
-        msg["Subject"] = subject
-
-        # Attach HTML content
-        msg.attach(MIMEText(content, "html"))
-
-        # Send email
-        with smtplib.SMTP(settings.SMTP_SERVER, settings.SMTP_PORT) as server:
-            if settings.SMTP_USER and settings.SMTP_PASSWORD:
-                server.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
-            server.send_message(msg)
-
-        # Mark as notified
-        analysis.notified = True
-
-        # Add notification record
-        notification = Notification(
-            analysis_id=analysis.id,
-            recipient=settings.EMAILS_TO_EMAIL,
-            subject=subject,
-            content=content
-        )
-
-        db.add(notification)
-        db.commit()
-
-        logger.info(f"Notification sent for analysis {analysis.id}")
-        return True
-
-    except Exception as e:
-        logger.error(f"Error sending notification: {str(e)}")
-        return False
\ No newline at end of file
@@ -0,0 +1,186 @@
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import Response
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Tuple
+import hashlib
+import threading
+import time
+import logging
+
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal, dialect_insert
+from app.db.models import DataVersion
+
+logger = logging.getLogger(__name__)
+
+# Cached GET routes by path prefix, with the data each one reads
+CACHED_ROUTES = (
+    (f"{settings.API_V1_STR}/campaigns", ("campaigns",)),
+    (f"{settings.API_V1_STR}/analyses", ("analyses", "recommendations")),
+    (f"{settings.API_V1_STR}/recommendations", ("recommendations",)),
+)
+
+# Streamed responses are never buffered into the cache
+UNCACHED_SUFFIXES = ("/export",)
+
+
+def bump_versions(db: Session, *names: str):
+    """
+    Invalidate cached responses reading names, as part of the caller's transaction.
+
+    The counters live in the data_versions table, so every API process sees
+    the change; this process drops its copy of them once the transaction
+    commits.
+    """
+    now = datetime.now(timezone.utc)
+    table = DataVersion.__table__
+    statement = dialect_insert(db, table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.name],
+        set_={"version": table.c.version + 1, "updated_at": now}
+    )
+    db.execute(statement, [{"name": name, "version": 1, "updated_at": now} for name in names])
+    db.info["data_versions_bumped"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session: Session):
+    if session.info.pop("data_versions_bumped", False):
+        response_cache.expire_versions()
+
+
+class ResponseCache:
+    """
+    In-process LRU of GET response bodies, keyed by route, normalized query and data versions.
+
+    Entries are never invalidated one by one: once a version counter moves,
+    keys built from the old value simply stop matching and age out of the
+    LRU. Version counters are re-read from the database at most every
+    RESPONSE_CACHE_VERSION_TTL seconds.
+    """
+
+    def __init__(self, size: int, version_ttl: float):
+        self.size = size
+        self.version_ttl = version_ttl
+        self._entries = OrderedDict()  # key -> (status, headers, body)
+        self._lock = threading.Lock()
+        self._versions: Dict[str, int] = {}
+        self._versions_loaded_at = 0.0
+        self.hits = 0
+        self.not_modified = 0
+        self.misses = 0
+
+    async def versions(self) -> Dict[str, int]:
+        if time.monotonic() - self._versions_loaded_at > self.version_ttl:
+            async with AsyncSessionLocal() as db:
+                rows = await db.execute(select(DataVersion.name, DataVersion.version))
+                self._versions = {name: version for name, version in rows}
+            self._versions_loaded_at = time.monotonic()
+        return self._versions
+
+    def expire_versions(self):
+        self._versions_loaded_at = 0.0
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def count_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def put(self, key: str, entry: Tuple[int, list, bytes]):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "not_modified": self.not_modified,
+                "misses": self.misses,
+                "versions": dict(self._versions),
+            }
+
+
+response_cache = ResponseCache(settings.RESPONSE_CACHE_SIZE, settings.RESPONSE_CACHE_VERSION_TTL)
+
+
+class ResponseCacheMiddleware(BaseHTTPMiddleware):
+    """
+    Serve repeated GETs of CACHED_ROUTES from response_cache, with ETag revalidation.
+
+    The ETag is derived from the cache key, so If-None-Match is answered
+    with 304 before the route (or the database) is touched.
+    """
+
+    async def dispatch(self, request: Request, call_next):
+        names = _cached_names(request)
+        if names is None:
+            return await call_next(request)
+
+        versions = await response_cache.versions()
+        key = _cache_key(request, names, versions)
+        etag = f'W/"{hashlib.sha1(key.encode()).hexdigest()[:20]}"'
+        cache_headers = {"ETag": etag, "Cache-Control": f"private, max-age={settings.RESPONSE_CACHE_MAX_AGE}"}
+
+        if etag in _if_none_match(request):
+            response_cache.count_not_modified()
+            return Response(status_code=304, headers=cache_headers)
+
+        entry = response_cache.get(key)
+        if entry is None:
+            response = await call_next(request)
+            if response.status_code != 200:
+                return response
+
+            body = b"".join([chunk async for chunk in response.body_iterator])
+            headers = [(name, value) for name, value in response.headers.items() if name.lower() != "content-length"]
+            entry = (response.status_code, headers, body)
+            response_cache.put(key, entry)
+
+        status_code, headers, body = entry
+        response = Response(content=body, status_code=status_code)
+        for name, value in headers:
+            response.headers[name] = value
+        response.headers.update(cache_headers)
+        return response
+
+
+def _cached_names(request: Request):
+    """Data names a request depends on, or None when it is not cacheable."""
+    if not settings.RESPONSE_CACHE_ENABLED or request.method != "GET":
+        return None
+    path = request.url.path
+    if path.endswith(UNCACHED_SUFFIXES):
+        return None
+    for prefix, names in CACHED_ROUTES:
+        if path == prefix or path.startswith(prefix + "/"):
+            return names
+    return None
+
+
+def _cache_key(request: Request, names, versions: Dict[str, int]) -> str:
+    # Parameter order and repeated parameters don't make distinct entries
+    query = "&".join(f"{name}={value}" for name, value in sorted(request.query_params.multi_items()))
+    data = ",".join(f"{name}:{versions.get(name, 0)}" for name in names)
+    return f"{request.url.path}?{query}#{data}"
+
+
+def _if_none_match(request: Request):
+    header = request.headers.get("if-none-match", "")
+    return {tag.strip() for tag in header.split(",") if tag.strip()}
@@ -0,0 +1,215 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func, select, insert, delete, literal, cast, and_, text, Date
+from datetime import date, timedelta
+from itertools import combinations
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+
+from app.db.database import dialect_insert
+from app.db.models import Campaign, CampaignRollup
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = ("day", "week", "month")
+DIMENSIONS = ("campaign_name", "platform", "region")
+MEASURES = ("impressions", "clicks", "conversions", "spend")
+
+# Every subset of the dimensions, from totals to the full series key
+GROUPINGS = [grouping for size in range(len(DIMENSIONS) + 1) for grouping in combinations(DIMENSIONS, size)]
+
+# Placeholder for dimensions a rollup row is not grouped on
+ALL = ""
+
+# Postgres advisory lock class of rollup writers: object 0 guards full
+# refreshes, object n the campaign rows of the day with ordinal n
+ROLLUP_LOCK_KEY = 0x0A11ED
+
+
+def grouping_key(dimensions) -> str:
+    """Canonical group_by value of a set of dimensions."""
+    return ",".join(dimension for dimension in DIMENSIONS if dimension in dimensions)
+
+
+def period_start(value: date, granularity: str) -> date:
+    """First day of the day, (ISO) week or month containing value."""
+    if granularity == "week":
+        return value - timedelta(days=value.weekday())
+    if granularity == "month":
+        return value.replace(day=1)
+    return value
+
+
+def period_end(value: date, granularity: str) -> date:
+    """Last day of the period containing value."""
+    if granularity == "week":
+        return period_start(value, granularity) + timedelta(days=6)
+    if granularity == "month":
+        return (value.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    return value
+
+
+def refresh_rollups(db: Session, start_date: Optional[date] = None, end_date: Optional[date] = None):
+    """
+    Recompute the rollups of every period touching [start_date, end_date], without committing.
+
+    Each granularity and grouping is rebuilt with one DELETE and one
+    INSERT ... SELECT over the campaign rows of the affected periods only;
+    without dates everything is rebuilt. Holds off batches applying
+    deltas (see lock_rollup_days) until the transaction ends.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_advisory_xact_lock(:key, 0)"), {"key": ROLLUP_LOCK_KEY})
+
+    for granularity in GRANULARITIES:
+        filters = []
+        rollup_filters = [CampaignRollup.granularity == granularity]
+        if start_date is not None and end_date is not None:
+            first, last = period_start(start_date, granularity), period_end(end_date, granularity)
+            filters.append(Campaign.date.between(first, last))
+            rollup_filters.append(CampaignRollup.period_start.between(first, last))
+
+        db.execute(delete(CampaignRollup).filter(*rollup_filters))
+
+        period = _period_expression(db, granularity)
+        for grouping in GROUPINGS:
+            grouped = [getattr(Campaign, dimension) for dimension in grouping]
+            statement = select(
+                literal(granularity),
+                literal(grouping_key(grouping)),
+                period,
+                *[getattr(Campaign, dimension) if dimension in grouping else literal(ALL) for dimension in DIMENSIONS],
+                func.count(Campaign.id),
+                *[func.sum(getattr(Campaign, measure)) for measure in MEASURES]
+            ).filter(*filters).group_by(period, *grouped)
+
+            db.execute(insert(CampaignRollup).from_select(
+                ["granularity", "group_by", "period_start", *DIMENSIONS, "rows", *MEASURES],
+                statement
+            ))
+
+    logger.info(f"Refreshed campaign rollups for {start_date or 'all dates'} to {end_date or 'all dates'}")
+
+
+def lock_rollup_days(db: Session, days: Iterable[date]):
+    """
+    Serialize rollup maintenance of the given days until the transaction ends (Postgres only).
+
+    Batches writing the same days queue up, so each reads the previous
+    values apply_rollup_deltas subtracts after the other committed. Days
+    are locked in order, so overlapping batches cannot deadlock; a full
+    refresh excludes every batch.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    db.execute(text("SELECT pg_advisory_xact_lock_shared(:key, 0)"), {"key": ROLLUP_LOCK_KEY})
+    db.execute(
+        text("SELECT pg_advisory_xact_lock(:key, day) FROM (SELECT unnest(CAST(:days AS integer[])) AS day ORDER BY 1) AS days"),
+        {"key": ROLLUP_LOCK_KEY, "days": sorted({day.toordinal() for day in days})}
+    )
+
+
+def apply_rollup_deltas(db: Session, rows: List[dict], previous: Dict[Tuple, dict]):
+    """
+    Add the change a batch of written campaign rows makes to the rollups they fall in, without committing.
+
+    previous maps the (campaign_name, platform, region, date) keys that
+    already existed to their former measures, which are subtracted. The
+    cost follows the batch, not the data of the periods it touches; callers
+    hold lock_rollup_days for the batch's days.
+    """
+    deltas = {}
+    for row in rows:
+        old = previous.get((*[row[dimension] for dimension in DIMENSIONS], row["date"]))
+        change = [0 if old is not None else 1] + [
+            float(row[measure]) - (float(old[measure]) if old is not None else 0) if measure == "spend"
+            else row[measure] - (old[measure] if old is not None else 0)
+            for measure in MEASURES
+        ]
+        if not any(change):
+            continue
+
+        for granularity in GRANULARITIES:
+            start = period_start(row["date"], granularity)
+            for grouping in GROUPINGS:
+                group = (granularity, grouping_key(grouping), start,
+                         *[row[dimension] if dimension in grouping else ALL for dimension in DIMENSIONS])
+                total = deltas.setdefault(group, [0] * (len(MEASURES) + 1))
+                for i, value in enumerate(change):
+                    total[i] += value
+
+    if not deltas:
+        return
+
+    columns = ("granularity", "group_by", "period_start", *DIMENSIONS)
+    totals = ("rows", *MEASURES)
+    # Sorted so concurrent batches lock shared week and month rows in the same order
+    values = [
+        {**dict(zip(columns, group)), **dict(zip(totals, total)), "spend": round(total[-1], 2)}
+        for group, total in sorted(deltas.items())
+    ]
+
+    table = CampaignRollup.__table__
+    statement = dialect_insert(db, table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c[column] for column in columns],
+        set_={column: table.c[column] + statement.excluded[column] for column in totals}
+    )
+    db.execute(statement, values)
+
+
+def summary_statement(group_by: List[str], granularity: str, start_date: Optional[date] = None,
+                      end_date: Optional[date] = None, **dimension_filters):
+    """
+    Select period totals grouped by group_by from the rollups.
+
+    Filtered dimensions are read from the rollup that is also grouped on
+    them and summed away, so a query touches O(groups x periods) rows
+    however many campaign rows they cover. Date bounds select the periods
+    they fall in.
+    """
+    filters = {dimension: value for dimension, value in dimension_filters.items() if value}
+    rollup_grouping = grouping_key(set(group_by) | set(filters))
+
+    conditions = [
+        CampaignRollup.granularity == granularity,
+        CampaignRollup.group_by == rollup_grouping,
+        *[getattr(CampaignRollup, dimension) == value for dimension, value in filters.items()]
+    ]
+    if start_date:
+        conditions.append(CampaignRollup.period_start >= period_start(start_date, granularity))
+    if end_date:
+        conditions.append(CampaignRollup.period_start <= end_date)
+
+    grouped = [getattr(CampaignRollup, dimension) for dimension in DIMENSIONS if dimension in group_by]
+    return select(
+        CampaignRollup.period_start,
+        *grouped,
+        func.sum(CampaignRollup.rows).label("rows"),
+        *[func.sum(getattr(CampaignRollup, measure)).label(measure) for measure in MEASURES]
+    ).filter(and_(*conditions)).group_by(
+        CampaignRollup.period_start, *grouped
+    ).order_by(CampaignRollup.period_start, *grouped)
+
+
+def summary_row(row) -> dict:
+    """Totals of a summary row, with ratios computed from the summed components."""
+    summary = dict(row._mapping)
+    impressions, clicks, conversions = summary["impressions"], summary["clicks"], summary["conversions"]
+    spend = float(summary["spend"])
+    summary["spend"] = spend
+    summary["ctr"] = clicks / impressions if impressions > 0 else 0
+    summary["cpc"] = spend / clicks if clicks > 0 else 0
+    summary["cpa"] = spend / conversions if conversions > 0 else 0
+    return summary
+
+
+def _period_expression(db: Session, granularity: str):
+    """SQL expression of the period start of Campaign.date."""
+    if granularity == "day":
+        return Campaign.date
+    if db.get_bind().dialect.name == "postgresql":
+        return cast(func.date_trunc(granularity, Campaign.date), Date)
+    # SQLite date modifiers: Monday of the week, first of the month
+    if granularity == "week":
+        return func.date(Campaign.date, "weekday 0", "-6 days")
+    return func.date(Campaign.date, "start of month")
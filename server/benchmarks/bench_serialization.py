@@ -0,0 +1,82 @@
+"""
+Compare the default and fast list-endpoint paths at several page sizes.
+
+Runs against a temporary SQLite database filled with synthetic campaigns
+unless --database-url is given. Usage, from the server directory:
+
+    python -m benchmarks.bench_serialization --rows 100,1000,10000
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="100,1000,10000", help="Comma-separated page sizes")
+    parser.add_argument("--repeat", type=int, default=7, help="Timed requests per page size and path")
+    parser.add_argument("--database-url", help="Benchmark an existing database instead of a synthetic one")
+    return parser.parse_args()
+
+
+def seed_campaigns(count: int):
+    from benchmarks.synthetic import generate_campaigns, load_campaigns, create_schema
+
+    create_schema()
+    series = 100
+    rows, _ = generate_campaigns(series, -(-count // series))
+    load_campaigns(rows)
+
+
+def time_requests(client, url: str, repeat: int):
+    client.get(url)  # Warm up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(url)
+        timings.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+    return statistics.median(timings), response
+
+
+def main():
+    args = parse_args()
+    sizes = [int(size) for size in args.rows.split(",")]
+
+    # Configure the app before it is imported
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    os.environ["RESPONSE_CACHE_ENABLED"] = "false"
+    os.environ["JOB_WORKERS"] = "0"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from fastapi.testclient import TestClient
+    from app.core.config import settings
+    import main as app_main
+
+    if not args.database_url:
+        seed_campaigns(max(sizes))
+
+    print(f"{'rows':>8} {'default ms':>12} {'fast ms':>10} {'speedup':>8}")
+    with TestClient(app_main.app) as client:
+        for size in sizes:
+            url = f"{settings.API_V1_STR}/campaigns/?limit={size}"
+            settings.FAST_LIST_RESPONSES = False
+            default_ms, default_response = time_requests(client, url, args.repeat)
+            settings.FAST_LIST_RESPONSES = True
+            fast_ms, fast_response = time_requests(client, url, args.repeat)
+
+            # Both paths must produce the same document
+            if json.loads(default_response.content) != json.loads(fast_response.content):
+                raise SystemExit(f"Responses differ at {size} rows")
+            print(f"{size:>8} {default_ms:>12.1f} {fast_ms:>10.1f} {default_ms / fast_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Check the anomaly detectors against their reference results on synthetic data.
+
+For each scale (SERIESxDAYS), over the usual 10-day window:
+
+- with the default configuration, detect_anomalies matches the legacy
+  find_anomalies_in_group loop over the window's rows, order included;
+- an expanding_mean metric finds the same anomalies whatever detectors
+  the other metrics use, so one detector's warm-up never leaks into another;
+- for every registered detector, incremental runs (detect_new_anomalies)
+  split across two loads find the same anomalies and end in the same saved
+  states as a single run, which in turn matches detect_anomalies.
+
+Exits non-zero on the first mismatch. From the server directory:
+
+    python -m benchmarks.check_detectors --scales 30x30,100x60
+
+Without --database-url a temporary SQLite database is used; a Postgres URL
+must point at a throwaway database with the init.sql schema.
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import timedelta
+
+from benchmarks.run_benchmarks import configure_environment, reset_tables
+from benchmarks.synthetic import generate_campaigns, load_campaigns, create_schema
+
+# Days analysed by a run, as in run_analysis
+WINDOW_DAYS = 10
+
+# Days before the end of the data where incremental checks split the load
+SPLIT_DAYS = 4
+
+# Detector of the other metrics in the warm-up isolation check
+NEIGHBOUR_DETECTOR = "seasonal"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="30x30,100x60", help="Comma-separated SERIESxDAYS data scales")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", help="Throwaway database to check against")
+    return parser.parse_args()
+
+
+def fingerprint(anomaly) -> tuple:
+    """What two runs must agree on for an anomaly; values rounded past float noise."""
+    return (
+        anomaly["campaign_name"], anomaly["platform"], anomaly["region"], anomaly["metric"], anomaly["date"],
+        anomaly["severity"], round(anomaly["value"], 9), round(anomaly["expected_value"], 9)
+    )
+
+
+def expect_equal(check: str, actual: list, expected: list):
+    """Compare two anomaly lists, order included, and stop on a mismatch."""
+    actual, expected = [fingerprint(a) for a in actual], [fingerprint(a) for a in expected]
+    if actual != expected:
+        missing = [a for a in expected if a not in actual]
+        extra = [a for a in actual if a not in expected]
+        print(f"FAIL {check}: {len(actual)} anomalies, expected {len(expected)}", file=sys.stderr)
+        for label, entries in (("missing", missing), ("extra", extra)):
+            for entry in entries[:5]:
+                print(f"  {label}: {entry}", file=sys.stderr)
+        sys.exit(1)
+    print(f"  ok {check}: {len(actual)} anomalies", file=sys.stderr)
+
+
+def configure_detectors(spec: dict):
+    from app.core.config import settings
+    settings.ANOMALY_DETECTORS = json.dumps(spec)
+
+
+def window(db):
+    from sqlalchemy import func
+    from app.db.models import Campaign
+
+    end_date = db.query(func.max(Campaign.date)).scalar()
+    return end_date - timedelta(days=WINDOW_DAYS - 1), end_date
+
+
+def check_default_parity(db):
+    """The default detectors reproduce find_anomalies_in_group over the window."""
+    from app.db.models import Campaign
+    from app.services.analysis_service import detect_anomalies, find_anomalies_in_group
+
+    start_date, end_date = window(db)
+    groups = {}
+    campaigns = db.query(Campaign).filter(Campaign.date.between(start_date, end_date)).order_by(
+        Campaign.campaign_name, Campaign.platform, Campaign.region, Campaign.date
+    )
+    for campaign in campaigns:
+        groups.setdefault((campaign.campaign_name, campaign.platform, campaign.region), []).append(campaign)
+    expected = [anomaly for key, rows in groups.items() for anomaly in find_anomalies_in_group(rows, key)]
+
+    expect_equal("default detectors match find_anomalies_in_group", detect_anomalies(db, start_date, end_date), expected)
+
+
+def check_warmup_isolation(db):
+    """Expanding-mean metrics are unaffected by a neighbour detector's longer warm-up."""
+    from app.services.analysis_service import detect_anomalies
+
+    start_date, end_date = window(db)
+    alone = detect_anomalies(db, start_date, end_date)
+    configure_detectors({"ctr": NEIGHBOUR_DETECTOR, "cpc": "expanding_mean", "cpa": "expanding_mean"})
+    mixed = detect_anomalies(db, start_date, end_date)
+
+    def expanding(anomalies):
+        return [anomaly for anomaly in anomalies if anomaly["metric"] != "ctr"]
+    expect_equal(f"expanding_mean next to {NEIGHBOUR_DETECTOR}", expanding(mixed), expanding(alone))
+
+
+def incremental_run(db, bootstrap_date):
+    """One incremental run, committing its states as run_analysis would."""
+    from app.services.analysis_service import detect_new_anomalies, save_series_states
+
+    anomalies, states = detect_new_anomalies(db, bootstrap_date)
+    save_series_states(db, states)
+    db.commit()
+    return anomalies
+
+
+def saved_states(db) -> dict:
+    from app.db.models import SeriesState
+
+    return {
+        (state.campaign_name, state.platform, state.region): (state.last_date, state.count, state.detector_state)
+        for state in db.query(SeriesState)
+    }
+
+
+def check_incremental(rows, name: str):
+    """Two incremental runs equal one, and one equals a full detect_anomalies run."""
+    from app.db.database import SessionLocal
+    from app.services.analysis_service import detect_anomalies
+
+    configure_detectors({metric: name for metric in ("ctr", "cpc", "cpa")})
+    last_date = max(row["date"] for row in rows)
+    cut = last_date - timedelta(days=SPLIT_DAYS)
+
+    db = SessionLocal()
+    try:
+        reset_tables()
+        load_campaigns(rows)
+        start_date, end_date = window(db)
+        full = detect_anomalies(db, start_date, end_date)
+        single = incremental_run(db, start_date)
+        single_states = saved_states(db)
+
+        reset_tables()
+        load_campaigns([row for row in rows if row["date"] <= cut])
+        split = incremental_run(db, start_date)
+        load_campaigns([row for row in rows if row["date"] > cut])
+        split += incremental_run(db, start_date)
+        # Back into one run's order: series, then date (sorted() is stable, keeping metrics in order)
+        split = sorted(split, key=lambda a: (a["campaign_name"], a["platform"], a["region"], a["date"]))
+        split_states = saved_states(db)
+    finally:
+        db.close()
+
+    expect_equal(f"{name}: incremental run matches detect_anomalies", single, full)
+    expect_equal(f"{name}: two incremental runs match one", split, single)
+    if split_states != single_states:
+        print(f"FAIL {name}: saved states differ between one and two incremental runs", file=sys.stderr)
+        sys.exit(1)
+
+
+def check_scale(series: int, days: int, seed: int):
+    from app.db.database import SessionLocal
+    from app.services.detectors import DETECTORS
+
+    rows, _ = generate_campaigns(series, days, seed=seed)
+    print(f"Scale {series}x{days}: {len(rows)} campaign rows", file=sys.stderr)
+
+    reset_tables()
+    load_campaigns(rows)
+    configure_detectors({metric: "expanding_mean" for metric in ("ctr", "cpc", "cpa")})
+    db = SessionLocal()
+    try:
+        check_default_parity(db)
+        check_warmup_isolation(db)
+    finally:
+        db.close()
+
+    for name in DETECTORS:
+        check_incremental(rows, name)
+
+
+def main():
+    args = parse_args()
+    configure_environment(args.database_url)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    import logging
+    logging.disable(logging.WARNING)
+
+    create_schema()
+    for scale in args.scales.split(","):
+        series, days = (int(part) for part in scale.lower().split("x"))
+        check_scale(series, days, args.seed)
+    print("All detector checks passed", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
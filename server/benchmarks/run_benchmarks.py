@@ -0,0 +1,268 @@
+"""
+Benchmark the analysis pipeline and the list endpoints at several data scales.
+
+Each scale (SERIESxDAYS) is loaded with synthetic data, then timed:
+detect_anomalies and the legacy find_anomalies_in_group loop over the whole
+range, run_analysis end to end with the LLM and SMTP stubbed out, and the
+list endpoints through the ASGI test client. Results are written as JSON;
+with --baseline, any benchmark slower than baseline x (1 + threshold) fails
+the run. From the server directory:
+
+    python -m benchmarks.run_benchmarks --scales 50x30,200x90 --output results.json
+    python -m benchmarks.run_benchmarks --baseline results.json --threshold 0.2
+
+Without --database-url a temporary SQLite database is used. A Postgres URL
+must point at a throwaway database with the init.sql schema: every table is
+emptied between scales.
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks.synthetic import generate_campaigns, load_campaigns, create_schema
+
+LIST_ENDPOINTS = (
+    "/campaigns/?limit=1000",
+    "/analyses/?limit=1000",
+    "/recommendations/?limit=1000",
+    "/campaigns/summary?group_by=platform&granularity=week",
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="50x30,200x90", help="Comma-separated SERIESxDAYS data scales")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", help="Throwaway database to benchmark against")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown over the baseline (0.2 = 20%%)")
+    return parser.parse_args()
+
+
+def configure_environment(database_url):
+    """Settings are read at import time, so set them before the app is imported."""
+    os.environ["DATABASE_URL"] = database_url or f"sqlite:///{tempfile.mkdtemp()}/benchmarks.db"
+    os.environ["JOB_WORKERS"] = "0"
+    os.environ["RESPONSE_CACHE_ENABLED"] = "false"
+    os.environ["LLM_REQUESTS_PER_SECOND"] = "1000000"
+    os.environ["LLM_TOKENS_PER_MINUTE"] = "1000000000"
+    os.environ.setdefault("MISTRAL_API_KEY", "benchmark")
+
+
+def stub_external_services():
+    """Answer LLM calls from an in-process transport and swallow emails."""
+    import httpx
+    import smtplib
+    from app.services import llm_service
+
+    def complete(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        prompt = body["messages"][0]["content"]
+        if body.get("response_format"):
+            content = json.dumps({analysis_id: "Stub recommendation." for analysis_id in re.findall(r'"id":(\d+)', prompt)})
+        else:
+            content = "Stub recommendation."
+        return httpx.Response(200, json={"choices": [{"message": {"content": content}}]})
+
+    llm_service._new_client = lambda: httpx.AsyncClient(transport=httpx.MockTransport(complete))
+
+    class StubSMTP:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def login(self, *args):
+            pass
+
+        def send_message(self, msg):
+            pass
+
+        def quit(self):
+            pass
+
+    smtplib.SMTP = StubSMTP
+
+
+def reset_tables(*tables):
+    """Empty tables (all of them by default), children first."""
+    from app.db.database import Base, SessionLocal
+
+    db = SessionLocal()
+    try:
+        for table in reversed(Base.metadata.sorted_tables):
+            if not tables or table.name in tables:
+                db.execute(table.delete())
+        db.commit()
+    finally:
+        db.close()
+
+
+def measure(fn, repeat: int, setup=None) -> dict:
+    """Time fn after an untimed warm-up; setup runs untimed before every call."""
+    timings = []
+    for run in range(repeat + 1):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        if run:
+            timings.append(elapsed)
+    return {
+        "runs": repeat,
+        "median_ms": round(statistics.median(timings), 3),
+        "min_ms": round(min(timings), 3),
+        "max_ms": round(max(timings), 3),
+    }
+
+
+def benchmark_scale(series: int, days: int, args) -> list:
+    from fastapi.testclient import TestClient
+    from sqlalchemy import func
+    from app.core.config import settings
+    from app.db.database import SessionLocal
+    from app.db.models import Campaign
+    from app.services import analysis_service
+    from app.services.llm_cache import llm_cache
+    import main as app_main
+
+    scale = f"{series}x{days}"
+    reset_tables()
+    rows, anomalies = generate_campaigns(series, days, seed=args.seed)
+    load_campaigns(rows)
+    print(f"Scale {scale}: {len(rows)} campaign rows, {len(anomalies)} injected anomalies", file=sys.stderr)
+
+    results = []
+
+    def record(name, timing):
+        results.append({"benchmark": name, "scale": scale, "series": series, "days": days, "rows": len(rows), **timing})
+        print(f"  {name:<60} {timing['median_ms']:>10.1f} ms", file=sys.stderr)
+
+    db = SessionLocal()
+    try:
+        start_date, end_date = db.query(func.min(Campaign.date), func.max(Campaign.date)).one()
+        record("detect_anomalies", measure(
+            lambda: analysis_service.detect_anomalies(db, start_date, end_date), args.repeat
+        ))
+
+        # The legacy loop gets its groups pre-loaded; only the scoring is timed
+        groups = {}
+        for campaign in db.query(Campaign).order_by(Campaign.date):
+            groups.setdefault((campaign.campaign_name, campaign.platform, campaign.region), []).append(campaign)
+        record("find_anomalies_in_group", measure(
+            lambda: [analysis_service.find_anomalies_in_group(campaigns, key) for key, campaigns in groups.items()],
+            args.repeat
+        ))
+    finally:
+        db.close()
+
+    def reset_analyses():
+        reset_tables("notifications", "recommendations", "analyses", "series_states", "llm_cache_entries")
+        llm_cache.clear_memory()
+
+    def run_analysis():
+        session = SessionLocal(expire_on_commit=False)
+        try:
+            analysis_service.run_analysis(session)
+        finally:
+            session.close()
+
+    record("run_analysis", measure(run_analysis, args.repeat, setup=reset_analyses))
+
+    with TestClient(app_main.app) as client:
+        for endpoint in LIST_ENDPOINTS:
+            url = f"{settings.API_V1_STR}{endpoint}"
+            record(f"GET {endpoint}", measure(lambda: client.get(url).raise_for_status(), args.repeat))
+
+    return results
+
+
+def compare(results: list, baseline: dict, threshold: float) -> list:
+    """Return the results slower than their baseline entry by more than threshold."""
+    previous = {(entry["benchmark"], entry["scale"]): entry for entry in baseline["results"]}
+    regressions = []
+    for entry in results:
+        before = previous.get((entry["benchmark"], entry["scale"]))
+        if before is None:
+            continue
+        ratio = entry["median_ms"] / before["median_ms"] if before["median_ms"] else 1.0
+        entry["baseline_median_ms"] = before["median_ms"]
+        entry["ratio"] = round(ratio, 3)
+        if ratio > 1 + threshold:
+            regressions.append(entry)
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    args = parse_args()
+    configure_environment(args.database_url)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    import logging
+    logging.disable(logging.WARNING)
+
+    create_schema()
+    stub_external_services()
+
+    from app.db.database import engine
+
+    results = []
+    for scale in args.scales.split(","):
+        series, days = (int(part) for part in scale.lower().split("x"))
+        results.extend(benchmark_scale(series, days, args))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": engine.dialect.name,
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        report["meta"]["baseline"] = args.baseline
+        report["meta"]["threshold"] = args.threshold
+        report["regressions"] = [f"{entry['benchmark']} @ {entry['scale']}" for entry in regressions]
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    for entry in regressions:
+        print(
+            f"REGRESSION {entry['benchmark']} @ {entry['scale']}: "
+            f"{entry['median_ms']:.1f} ms vs {entry['baseline_median_ms']:.1f} ms (x{entry['ratio']})",
+            file=sys.stderr
+        )
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Deterministic synthetic campaign data with injected anomalies.
+
+The same arguments always produce the same rows. Load them into the
+configured database (or --database-url, SQLite or Postgres with the
+init.sql schema), from the server directory:
+
+    python -m benchmarks.synthetic --series 200 --days 90 --anomaly-rate 0.01
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+from datetime import date, timedelta
+from typing import List, Tuple
+
+PLATFORMS = ("Facebook", "Google", "LinkedIn", "TikTok")
+REGIONS = ("North America", "Europe", "Asia", "Latin America")
+
+# Days each series gets before anomalies may be injected, so there is history to compare with
+WARMUP_DAYS = 3
+
+# Multipliers applied to an injected anomaly's metric: spikes and drops
+ANOMALY_FACTORS = (0.2, 0.3, 3.0, 4.0)
+
+
+def series_key(index: int) -> Tuple[str, str, str]:
+    """(campaign_name, platform, region) of the index-th series; unique per index."""
+    per_campaign = len(PLATFORMS) * len(REGIONS)
+    return (
+        f"Campaign {index // per_campaign:04d}",
+        PLATFORMS[index % len(PLATFORMS)],
+        REGIONS[(index // len(PLATFORMS)) % len(REGIONS)]
+    )
+
+
+def generate_campaigns(series: int, days: int, noise: float = 0.1, anomaly_rate: float = 0.01,
+                       seed: int = 42, start_date: date = date(2024, 1, 1)) -> Tuple[List[dict], List[dict]]:
+    """
+    Generate daily campaign rows plus the anomalies injected into them.
+
+    Each series has its own base volume, CTR, conversion rate and CPC, a
+    weekly seasonality and multiplicative log-normal noise of scale noise.
+    With probability anomaly_rate a series-day has one of ctr, cpc or cpa
+    multiplied by a factor from ANOMALY_FACTORS. Rows are ordered by date,
+    then series, so batched loads touch few rollup periods at a time.
+    """
+    rnd = random.Random(seed)
+    profiles = [
+        {
+            "impressions": rnd.uniform(2000, 20000),
+            "ctr": rnd.uniform(0.01, 0.06),
+            "conversion_rate": rnd.uniform(0.02, 0.1),
+            "cpc": rnd.uniform(0.3, 3.0),
+            "phase": rnd.uniform(0, 2 * math.pi),
+        }
+        for _ in range(series)
+    ]
+
+    rows, anomalies = [], []
+    for day in range(days):
+        current = start_date + timedelta(days=day)
+        for index, profile in enumerate(profiles):
+            season = 1 + 0.15 * math.sin(2 * math.pi * day / 7 + profile["phase"])
+            factors = {"ctr": 1.0, "cpc": 1.0, "cpa": 1.0}
+            if day >= WARMUP_DAYS and rnd.random() < anomaly_rate:
+                metric = rnd.choice(tuple(factors))
+                factors[metric] = rnd.choice(ANOMALY_FACTORS)
+                name, platform, region = series_key(index)
+                anomalies.append({
+                    "campaign_name": name,
+                    "platform": platform,
+                    "region": region,
+                    "date": current.isoformat(),
+                    "metric": metric,
+                    "factor": factors[metric]
+                })
+
+            impressions = max(1, int(profile["impressions"] * season * rnd.lognormvariate(0, noise)))
+            clicks = max(1, round(impressions * profile["ctr"] * factors["ctr"] * rnd.lognormvariate(0, noise)))
+            spend = round(clicks * profile["cpc"] * factors["cpc"] * rnd.lognormvariate(0, noise), 2)
+            # Conversions follow a CPC anomaly's spend, so only the injected metric moves
+            conversions = max(1, round(
+                clicks * profile["conversion_rate"] * rnd.lognormvariate(0, noise) * factors["cpc"] / factors["cpa"]
+            ))
+
+            name, platform, region = series_key(index)
+            rows.append({
+                "campaign_name": name,
+                "platform": platform,
+                "region": region,
+                "date": current,
+                "impressions": impressions,
+                "clicks": clicks,
+                "conversions": conversions,
+                "spend": spend
+            })
+
+    return rows, anomalies
+
+
+def load_campaigns(rows: List[dict], batch_size: int = None) -> int:
+    """Load rows through the ingestion path (upserts, derived metrics, rollups)."""
+    from app.core.config import settings
+    from app.db.database import SessionLocal
+    from app.schemas.campaign import CampaignCreate
+    from app.services.ingestion_service import load_campaign_batch
+
+    batch_size = batch_size or settings.INGEST_BATCH_SIZE
+    loaded = 0
+    db = SessionLocal()
+    try:
+        for offset in range(0, len(rows), batch_size):
+            campaigns = [CampaignCreate(**row) for row in rows[offset:offset + batch_size]]
+            loaded += load_campaign_batch(db, campaigns)
+    finally:
+        db.close()
+    return loaded
+
+
+def create_schema():
+    """Create missing tables from the models; Postgres databases should use init.sql instead."""
+    from app.db.database import Base, engine
+    from app.db import models  # noqa: F401 - registers the tables on Base
+
+    if engine.dialect.name != "postgresql":
+        Base.metadata.create_all(engine)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--series", type=int, default=200)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--noise", type=float, default=0.1, help="Scale of the multiplicative log-normal noise")
+    parser.add_argument("--anomaly-rate", type=float, default=0.01, help="Probability of an anomaly per series-day")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--start-date", type=date.fromisoformat, default=date(2024, 1, 1))
+    parser.add_argument("--database-url", help="Load into this database instead of the configured one")
+    parser.add_argument("--anomalies-out", help="Write the injected anomalies to this JSON file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    rows, anomalies = generate_campaigns(
+        args.series, args.days, args.noise, args.anomaly_rate, args.seed, args.start_date
+    )
+    create_schema()
+    loaded = load_campaigns(rows)
+    print(f"Loaded {loaded} campaign rows with {len(anomalies)} injected anomalies")
+
+    if args.anomalies_out:
+        with open(args.anomalies_out, "w") as f:
+            json.dump(anomalies, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
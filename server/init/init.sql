@@ -12,7 +12,26 @@ CREATE TABLE campaigns (
                            ctr DECIMAL(10, 4) GENERATED ALWAYS AS (CASE WHEN impressions > 0 THEN clicks::decimal / impressions ELSE 0 END) STORED,
     cpc DECIMAL(10, 4) GENERATED ALWAYS AS (CASE WHEN clicks > 0 THEN spend / clicks ELSE 0 END) STORED,
     cpa DECIMAL(10, 4) GENERATED ALWAYS AS (CASE WHEN conversions > 0 THEN spend / conversions ELSE 0 END) STORED,
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    -- One row per series and day; also serves series lookups by key and date
+    CONSTRAINT uq_campaigns_series_date UNIQUE (campaign_name, platform, region, date)
+);
+
+-- Campaign totals per period, for each combination of grouped dimensions
+CREATE TABLE campaign_rollups (
+                                  id SERIAL PRIMARY KEY,
+                                  granularity VARCHAR(10) NOT NULL,
+                                  group_by VARCHAR(50) NOT NULL,
+                                  period_start DATE NOT NULL,
+                                  campaign_name VARCHAR(100) NOT NULL DEFAULT '',
+                                  platform VARCHAR(50) NOT NULL DEFAULT '',
+                                  region VARCHAR(50) NOT NULL DEFAULT '',
+                                  rows INTEGER NOT NULL,
+                                  impressions BIGINT NOT NULL,
+                                  clicks BIGINT NOT NULL,
+                                  conversions BIGINT NOT NULL,
+                                  spend DECIMAL(14, 2) NOT NULL,
+                                  CONSTRAINT uq_campaign_rollups_group UNIQUE (granularity, group_by, period_start, campaign_name, platform, region)
 );
 
 CREATE TABLE analyses (
@@ -25,8 +44,14 @@ CREATE TABLE analyses (
                           expected_value DECIMAL(10, 4),
                           date_range_start DATE,
                           date_range_end DATE,
+                          campaign_name VARCHAR(100),
+                          platform VARCHAR(50),
+                          region VARCHAR(50),
                           created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                          notified BOOLEAN DEFAULT FALSE
+                          notified BOOLEAN DEFAULT FALSE,
+                          -- One finding per metric, date range and series; makes analysis runs idempotent.
+                          -- Aggregate findings leave rolled-up dimensions NULL, which must still match
+                          CONSTRAINT uq_analyses_finding UNIQUE NULLS NOT DISTINCT (type, metric, date_range_start, date_range_end, campaign_name, platform, region)
 );
 
 CREATE TABLE recommendations (
@@ -45,6 +70,102 @@ CREATE TABLE notifications (
                                sent_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+CREATE TABLE series_states (
+                               id SERIAL PRIMARY KEY,
+                               campaign_name VARCHAR(100) NOT NULL,
+                               platform VARCHAR(50) NOT NULL,
+                               region VARCHAR(50) NOT NULL,
+                               last_date DATE NOT NULL,
+                               count INTEGER NOT NULL DEFAULT 0,
+                               detector_state JSONB NOT NULL DEFAULT '{}',
+                               updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                               CONSTRAINT uq_series_states_series UNIQUE (campaign_name, platform, region)
+);
+
+-- Series written since near-real-time analysis last scored them
+CREATE TABLE changed_series (
+                                id SERIAL PRIMARY KEY,
+                                campaign_name VARCHAR(100) NOT NULL,
+                                platform VARCHAR(50) NOT NULL,
+                                region VARCHAR(50) NOT NULL,
+                                first_marked_at TIMESTAMP WITH TIME ZONE NOT NULL,
+                                last_marked_at TIMESTAMP WITH TIME ZONE NOT NULL,
+                                -- Earliest date written; rows at or before the series' watermark are rescored
+                                first_changed_date DATE NOT NULL,
+                                CONSTRAINT uq_changed_series_series UNIQUE (campaign_name, platform, region)
+);
+
+CREATE TABLE llm_cache_entries (
+                                   id SERIAL PRIMARY KEY,
+                                   fingerprint VARCHAR(64) NOT NULL UNIQUE,
+                                   content TEXT NOT NULL,
+                                   created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                                   last_used_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                                   hits INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX ix_llm_cache_entries_last_used_at ON llm_cache_entries (last_used_at);
+
+CREATE TABLE jobs (
+                      id SERIAL PRIMARY KEY,
+                      kind VARCHAR(50) NOT NULL,
+                      payload JSONB NOT NULL DEFAULT '{}',
+                      dedupe_key VARCHAR(200),
+                      status VARCHAR(20) NOT NULL DEFAULT 'pending',
+                      attempts INTEGER NOT NULL DEFAULT 0,
+                      max_attempts INTEGER NOT NULL DEFAULT 3,
+                      last_error TEXT,
+                      worker VARCHAR(100),
+                      run_after TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                      created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                      started_at TIMESTAMP WITH TIME ZONE,
+                      -- Lease renewed by the running worker; expired leases are reclaimed
+                      heartbeat_at TIMESTAMP WITH TIME ZONE,
+                      finished_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE INDEX idx_jobs_status_run_after ON jobs (status, run_after);
+-- Identical jobs are deduplicated while one is pending or running
+CREATE UNIQUE INDEX uq_jobs_active_dedupe_key ON jobs (dedupe_key) WHERE status IN ('pending', 'running');
+
+-- Change counters of cached API data
+CREATE TABLE data_versions (
+                               name VARCHAR(50) PRIMARY KEY,
+                               version BIGINT NOT NULL DEFAULT 0,
+                               updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Keyset pagination of the list endpoints, newest first
+CREATE INDEX idx_campaigns_date_id ON campaigns (date, id);
+CREATE INDEX idx_analyses_created_at_id ON analyses (created_at, id);
+CREATE INDEX idx_recommendations_created_at_id ON recommendations (created_at, id);
+
+-- Mark the series of every written campaign row, whether ingested or inserted directly.
+-- Ingestion sets app.mark_changed_series to 'off' for its transaction when
+-- near-real-time analysis is disabled; full runs then clear any other marks
+CREATE FUNCTION mark_changed_series() RETURNS trigger AS $$
+BEGIN
+    IF current_setting('app.mark_changed_series', true) = 'off' THEN
+        RETURN NULL;
+    END IF;
+    INSERT INTO changed_series (campaign_name, platform, region, first_marked_at, last_marked_at, first_changed_date)
+    SELECT campaign_name, platform, region, now(), now(), min(date) FROM written_rows
+    GROUP BY campaign_name, platform, region
+    ON CONFLICT (campaign_name, platform, region) DO UPDATE SET
+        last_marked_at = EXCLUDED.last_marked_at,
+        first_changed_date = LEAST(changed_series.first_changed_date, EXCLUDED.first_changed_date);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_campaigns_inserted_mark_series
+    AFTER INSERT ON campaigns REFERENCING NEW TABLE AS written_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION mark_changed_series();
+
+CREATE TRIGGER trg_campaigns_updated_mark_series
+    AFTER UPDATE ON campaigns REFERENCING NEW TABLE AS written_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION mark_changed_series();
+
 -- Insert data from Facebook Ads Dataset (this is just fake data)
 
 -- Campaign 1: Retargeting Campaign
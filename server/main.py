@@ -7,9 +7,15 @@ import logging
 from app import schemas
 
 # Then import routes
-from app.api.routes import campaigns, analyses, recommendations
+from app.api.routes import campaigns, analyses, recommendations, internal, jobs
 from app.core.config import settings
-from app.core.scheduler import setup_scheduler
+from app.core.scheduler import setup_scheduler, shutdown_scheduler
+from app.api.pagination import NEXT_CURSOR_HEADER
+from app.services.llm_service import open_shared_client, close_shared_client
+from app.services.response_cache import ResponseCacheMiddleware
+from app.api.instrumentation import MetricsMiddleware, metrics_response
+from app.services.job_queue import start_workers, stop_workers, enqueue_rollup_backfill
+from app.services.anomaly_engine import configured_detectors, shutdown_pool
 
 # Configure logging
 logging.basicConfig(
@@ -17,20 +23,29 @@ logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
 )
 
-# Global scheduler variable
+# Global scheduler and job worker variables
 scheduler = None
+job_workers = []
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup: initialize and start scheduler
-    global scheduler
+    global scheduler, job_workers
+    # Fail fast on an invalid ANOMALY_DETECTORS rather than in the first analysis job
+    configured_detectors()
     scheduler = setup_scheduler()
+    job_workers = start_workers(settings.JOB_WORKERS)
+    enqueue_rollup_backfill()
+    await open_shared_client()
 
     yield
 
     # Shutdown: clean up resources
     if scheduler:
-        scheduler.shutdown()
+        shutdown_scheduler(scheduler)
+    stop_workers(job_workers)
+    shutdown_pool()
+    await close_shared_client()
 
 # Create FastAPI app
 app = FastAPI(
@@ -39,6 +54,13 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Cache repeated reads; added before CORS so 304s still get CORS headers
+app.add_middleware(ResponseCacheMiddleware)
+
+# Wraps the response cache, so cache hits are measured too
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # Set up CORS
 app.add_middleware(
     CORSMiddleware,
@@ -46,6 +68,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag"],
 )
 
 # Include routers
@@ -64,6 +87,21 @@ app.include_router(
     prefix=f"{settings.API_V1_STR}/recommendations",
     tags=["recommendations"],
 )
+app.include_router(
+    jobs.router,
+    prefix=f"{settings.API_V1_STR}/jobs",
+    tags=["jobs"],
+)
+app.include_router(
+    internal.router,
+    prefix=f"{settings.API_V1_STR}/internal",
+    tags=["internal"],
+)
+
+if settings.METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    def get_metrics():
+        return metrics_response()
 
 @app.get("/")
 def read_root():